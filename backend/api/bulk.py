@@ -0,0 +1,76 @@
+"""
+Массовое добавление и удаление связей пользователя (избранное, корзина,
+подписки) по списку id в одной транзакции.
+
+Результат — статус для каждого переданного id:
+created / exists / not_found / forbidden при добавлении,
+deleted / missing при удалении.
+"""
+from django.contrib.auth import get_user_model
+
+from recipes.counters import change_counters
+
+User = get_user_model()
+
+
+def lock_user(user):
+    """
+    Сериализует изменения связей одного пользователя. Берут её и
+    массовые, и одиночные операции: иначе параллельная одиночная вставка
+    не попадёт в existing, её строку пропустит ignore_conflicts,
+    а счётчики и список покупок учтут её дважды.
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list())
+
+
+def bulk_add(user, ids, model, field, target_model, forbidden=()):
+    """Возвращает (статусы по id, список id реально добавленных)."""
+    found = set(
+        target_model.objects.filter(id__in=ids).values_list('id', flat=True)
+    )
+    lock_user(user)
+    existing = set(
+        model.objects.filter(
+            user=user, **{f'{field}_id__in': found}
+        ).values_list(f'{field}_id', flat=True)
+    )
+    statuses = {}
+    created = []
+    for object_id in ids:
+        if object_id not in found:
+            statuses[object_id] = 'not_found'
+        elif object_id in forbidden:
+            statuses[object_id] = 'forbidden'
+        elif object_id in existing:
+            statuses[object_id] = 'exists'
+        else:
+            statuses[object_id] = 'created'
+            created.append(object_id)
+    model.objects.bulk_create(
+        [model(user=user, **{f'{field}_id': pk}) for pk in created],
+        ignore_conflicts=True,
+    )
+    change_counters(model, created)
+    return statuses, created
+
+
+def bulk_remove(user, ids, model, field):
+    """Возвращает (статусы по id, список id реально удалённых)."""
+    lock_user(user)
+    rows = model.objects.filter(user=user, **{f'{field}_id__in': ids})
+    deleted = list(rows.values_list(f'{field}_id', flat=True))
+    rows.delete()
+    statuses = {
+        object_id: 'deleted' if object_id in deleted else 'missing'
+        for object_id in ids
+    }
+    return statuses, deleted
+
+
+def bulk_response_data(statuses):
+    return {
+        'results': [
+            {'id': object_id, 'status': status}
+            for object_id, status in statuses.items()
+        ]
+    }
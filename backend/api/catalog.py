@@ -0,0 +1,104 @@
+"""
+Справочники, которые строятся один раз на воркер.
+
+Версия каждого справочника хранится в общем кэше: изменение данных
+увеличивает её, и каждый воркер перестраивает свою копию при следующем
+обращении.
+"""
+import random
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+
+from api.snapshots import CatalogSnapshot
+from recipes.models import Tag
+
+CATALOG_VERSION_KEY = 'catalog-version:{}'
+
+
+def get_versions(keys):
+    """
+    {ключ: версия} из общего кэша. Отсутствующий ключ заводится со
+    случайной версией: после вытеснения из кэша новая версия не совпадёт
+    со старой, оставшейся в памяти воркера или в ключах кэша.
+    """
+    keys = list(keys)
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, random.getrandbits(62), None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def bump_version(key):
+    """
+    Увеличивает версию и возвращает новую. Если ключа нет, возвращает
+    None: следующий читатель заведёт новую случайную версию.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return None
+
+
+class VersionedCatalog:
+    """Значение `build()`, перестраиваемое при смене версии."""
+
+    def __init__(self, name, build):
+        self.key = CATALOG_VERSION_KEY.format(name)
+        self.build = build
+        self._version = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get_version(self):
+        return get_versions([self.key]).get(self.key)
+
+    def get(self):
+        version = self.get_version()
+        if version != self._version:
+            # Если версия сменится во время сборки, значение
+            # перестроится ещё раз при следующем обращении.
+            value = self.build()
+            with self._lock:
+                self._value, self._version = value, version
+        return self._value
+
+    def invalidate(self):
+        transaction.on_commit(self._bump)
+
+    def patch(self, apply):
+        """
+        Как invalidate, но свою копию воркер не перестраивает,
+        а меняет на месте через `apply(value)`, если его версия
+        была последней.
+        """
+        transaction.on_commit(lambda: self._bump(apply))
+
+    def _bump(self, apply=None):
+        version = bump_version(self.key)
+        if version is None or apply is None:
+            return
+        with self._lock:
+            if self._version is not None and self._version + 1 == version:
+                apply(self._value)
+                self._version = version
+
+
+class TagCatalog:
+    def __init__(self, tags):
+        self.items = list(tags)
+        self.ids_by_slug = {tag['slug']: tag['id'] for tag in self.items}
+
+    @cached_property
+    def snapshot(self):
+        return CatalogSnapshot(self.items)
+
+
+tag_catalog = VersionedCatalog(
+    'tags', lambda: TagCatalog(Tag.objects.values('id', 'name', 'slug'))
+)
@@ -1,43 +1,90 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import Recipe, Ingredient
+from api.catalog import tag_catalog
+from api.membership import UserMembership
+from foodgram.constants import BULK_MAX_IDS
+from recipes.models import Recipe, RecipeIngredient
+from recipes.search import search_recipes
 
 
-class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(method='filter_name')
+class NumberListFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Список id через запятую: ?ingredients=1,2,3."""
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
 
-    def filter_name(self, queryset, name, value):
-        queryset_start = queryset.filter(name__istartswith=value)
-        queryset_contains = queryset.filter(name__icontains=value).exclude(
-            id__in=queryset_start.values_list('id', flat=True)
-        )
-        return queryset_start | queryset_contains
+def limited_ids(name, value):
+    if len(value) > BULK_MAX_IDS:
+        raise ValidationError({name: [f'Не больше {BULK_MAX_IDS} id.']})
+    return set(value)
 
 
 class RecipeFilter(filters.FilterSet):
     author = filters.NumberFilter(field_name='author__id')
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=lambda: [
+            (slug, slug) for slug in tag_catalog.get().ids_by_slug
+        ],
+        method='filter_tags',
+    )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    search = filters.CharFilter(method='filter_search')
+    ingredients = NumberListFilter(method='filter_ingredients')
+    exclude_ingredients = NumberListFilter(
+        method='filter_exclude_ingredients'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ingredients', 'exclude_ingredients',
+        )
 
-    def filter_is_favorited(self, queryset, name, value):
-        user = getattr(self.request, 'user', None)
-        if value and user and user.is_authenticated:
-            return queryset.filter(favorited_by__user=user)
+    def filter_tags(self, queryset, name, value):
+        tags_map = tag_catalog.get().ids_by_slug
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=[tags_map[slug] for slug in value],
+            )
+        ))
+
+    def filter_ingredients(self, queryset, name, value):
+        # По EXISTS на каждый ингредиент: полусоединение по индексу
+        # (recipe, ingredient) не размножает строки рецептов.
+        for ingredient_id in limited_ids(name, value):
+            queryset = queryset.filter(Exists(
+                RecipeIngredient.objects.filter(
+                    recipe_id=OuterRef('pk'), ingredient_id=ingredient_id
+                )
+            ))
         return queryset
 
+    def filter_exclude_ingredients(self, queryset, name, value):
+        return queryset.exclude(Exists(
+            RecipeIngredient.objects.filter(
+                recipe_id=OuterRef('pk'),
+                ingredient_id__in=limited_ids(name, value),
+            )
+        ))
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_membership(queryset, 'favorites', value)
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_membership(queryset, 'shopping_cart', value)
+
+    def filter_membership(self, queryset, kind, value):
         user = getattr(self.request, 'user', None)
         if value and user and user.is_authenticated:
-            return queryset.filter(in_carts__user=user)
+            return queryset.filter(
+                id__in=UserMembership.for_request(self.request).get(kind)
+            )
         return queryset
@@ -0,0 +1,69 @@
+"""
+Кэш не зависящей от пользователя части представления рецепта.
+
+Во фрагменте лежит всё, что одинаково для любого зрителя: автор, теги,
+ингредиенты, текст и относительные ссылки на изображения. Персональные
+флаги и абсолютные URL накладываются при ответе.
+
+Ключ фрагмента содержит поколение рецепта. Изменение рецепта после
+коммита увеличивает поколение, а не удаляет фрагмент: читатель, который
+узнал поколение до коммита и собрал фрагмент из старых данных, положит
+его под старый ключ, и его больше никто не прочитает. Для этого
+данные рецепта нужно читать из базы после get_recipe_fragments.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from api.catalog import bump_version, get_versions
+from foodgram.constants import RECIPE_FRAGMENT_CACHE_TIMEOUT
+
+RECIPE_FRAGMENT_KEY = 'recipe-fragment:v3:{}:{}'
+RECIPE_GENERATION_KEY = 'recipe-generation:{}'
+
+
+def get_recipe_generations(recipe_ids):
+    keys = {RECIPE_GENERATION_KEY.format(pk): pk for pk in recipe_ids}
+    return {
+        keys[key]: generation
+        for key, generation in get_versions(keys).items()
+    }
+
+
+def get_recipe_fragments(recipe_ids):
+    """
+    Возвращает ({id рецепта: фрагмент} для найденных в кэше рецептов,
+    {id рецепта: поколение}); поколения нужны set_recipe_fragments.
+    """
+    generations = get_recipe_generations(recipe_ids)
+    keys = {
+        RECIPE_FRAGMENT_KEY.format(pk, generation): pk
+        for pk, generation in generations.items()
+    }
+    fragments = {
+        keys[key]: fragment
+        for key, fragment in cache.get_many(keys).items()
+    }
+    return fragments, generations
+
+
+def set_recipe_fragments(fragments, generations):
+    cache.set_many(
+        {
+            RECIPE_FRAGMENT_KEY.format(pk, generations[pk]): fragment
+            for pk, fragment in fragments.items()
+            if pk in generations
+        },
+        RECIPE_FRAGMENT_CACHE_TIMEOUT,
+    )
+
+
+def bump_recipe_generations(keys):
+    for key in keys:
+        bump_version(key)
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    """Меняет поколение рецептов после коммита транзакции."""
+    keys = [RECIPE_GENERATION_KEY.format(pk) for pk in set(recipe_ids)]
+    if keys:
+        transaction.on_commit(lambda: bump_recipe_generations(keys))
@@ -0,0 +1,87 @@
+"""
+Нарезка уменьшенных копий изображения в WebP и JPEG.
+
+Модуль не зависит от Django: функции выполняются в отдельных процессах
+пула (см. api.image_variants) и работают только с путями на диске.
+"""
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _resize(image, size, crop):
+    if crop:
+        return ImageOps.fit(image, (size, size), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def _flatten(image):
+    """JPEG не хранит прозрачность: подкладываем белый фон."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(source_path, target_dir, variants):
+    """
+    Сохраняет копии в target_dir и возвращает
+    {имя копии: {формат: имя файла}}. Уже готовые файлы не пересоздаются,
+    поэтому повторный запуск для того же исходника ничего не делает.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    result = {}
+    with Image.open(source_path) as source:
+        largest = max(size for size, _ in variants.values())
+        # JPEG декодируется сразу в уменьшенном масштабе.
+        source.draft('RGB', (largest, largest))
+        source = ImageOps.exif_transpose(source)
+        for name, (size, crop) in variants.items():
+            result[name] = {}
+            image = None
+            for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+                filename = f'{name}.{fmt}'
+                path = os.path.join(target_dir, filename)
+                result[name][fmt] = filename
+                if os.path.exists(path):
+                    continue
+                if image is None:
+                    image = _resize(source, size, crop)
+                converted = (
+                    _flatten(image) if pil_format == 'JPEG'
+                    else image.convert('RGBA' if 'A' in image.mode else 'RGB')
+                )
+                _save_atomic(converted, path, pil_format, options)
+    return result
+
+
+def _save_atomic(image, path, pil_format, options):
+    """
+    Пишет во временный файл с уникальным именем и переименовывает его.
+    Одинаковые загрузки дают один исходник, поэтому несколько задач
+    могут нарезать одни и те же копии одновременно: копии одинаковые,
+    так что чужой готовый файл — тоже успех.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f'.{os.path.basename(path)}.'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            image.save(tmp_file, pil_format, **options)
+        os.replace(tmp_path, path)
+    except OSError:
+        if not os.path.exists(path):
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,110 @@
+"""
+Уменьшенные копии изображений рецептов и аватаров.
+
+После сохранения модели с новым исходником задача уходит в пул
+процессов, поток запроса Pillow не трогает. Готовые имена файлов
+записываются в JSON-поле `<поле>_variants` вместе с именем исходника;
+пока они не совпадают с текущим изображением, копии не отдаются
+и клиент показывает оригинал.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+
+from api.fragments import invalidate_recipe_fragments
+from api.image_processing import render_variants
+from foodgram.constants import IMAGE_VARIANT_WORKERS, IMAGE_VARIANTS
+from foodgram.storage import variants_dir
+from recipes.models import Recipe
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: дочерние процессы не наследуют соединения с базой
+            # и потоки воркера.
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def variant_urls(image, variants):
+    """{копия: {формат: url}} или {}, если копии ещё не готовы."""
+    if not image or variants.get('source') != image.name:
+        return {}
+    return {
+        name: {
+            fmt: default_storage.url(f'{variants_dir(image.name)}/{file}')
+            for fmt, file in files.items()
+        }
+        for name, files in variants.items() if name != 'source'
+    }
+
+
+def needs_variants(instance, field):
+    image = getattr(instance, field)
+    variants = getattr(instance, f'{field}_variants')
+    return bool(image) and variants.get('source') != image.name
+
+
+def schedule_variants(instance, field):
+    """Ставит нарезку в очередь после коммита, если исходник сменился."""
+    if not needs_variants(instance, field):
+        return
+    source = getattr(instance, field).name
+    transaction.on_commit(
+        lambda: submit_variants(type(instance), instance.pk, field, source)
+    )
+
+
+def submit_variants(model, pk, field, source):
+    future = get_executor().submit(
+        render_variants,
+        default_storage.path(source),
+        default_storage.path(variants_dir(source)),
+        IMAGE_VARIANTS,
+    )
+    future.add_done_callback(partial(
+        _store_variants, model, pk, field, source, threading.get_ident()
+    ))
+    return future
+
+
+def _store_variants(model, pk, field, source, submitter, future):
+    try:
+        files = future.result()
+    except Exception:
+        logger.exception('Не удалось нарезать копии %s', source)
+        return
+    try:
+        # Если исходник успели заменить, запись не изменится.
+        updated = model.objects.filter(pk=pk, **{field: source}).update(
+            **{f'{field}_variants': {'source': source, **files}}
+        )
+        if updated:
+            invalidate_recipe_fragments(
+                [pk] if model is Recipe
+                else Recipe.objects.filter(author_id=pk).values_list(
+                    'id', flat=True
+                )
+            )
+    finally:
+        # Обычно колбэк выполняется в служебном потоке пула, и его
+        # соединения больше никому не нужны.
+        if threading.get_ident() != submitter:
+            connections.close_all()
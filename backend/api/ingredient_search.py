@@ -0,0 +1,226 @@
+"""
+Поиск ингредиентов по названию в памяти воркера.
+
+Каталог (пара тысяч строк) хранится отсортированным по нормализованному
+названию: совпадения по началу находятся двоичным поиском, вхождения
+в середину — через триграммный индекс. Совпадения по началу идут первыми.
+
+Нечёткий поиск работает по словам названий. Для каждого слова заранее
+построены все варианты с удалением до INGREDIENT_FUZZY_MAX_DISTANCE букв
+(symmetric delete): кандидаты для слова запроса находятся пересечением
+таких вариантов и проверяются ограниченным расстоянием Дамерау —
+Левенштейна, без обхода всего каталога.
+"""
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.utils.functional import cached_property
+
+from api.catalog import VersionedCatalog
+from api.snapshots import CatalogSnapshot
+from foodgram.constants import (
+    INGREDIENT_FUZZY_LIMIT, INGREDIENT_FUZZY_MAX_DISTANCE
+)
+from recipes.models import Ingredient
+
+NGRAM_SIZE = 3
+WORD_RE = re.compile(r'\w+')
+# Латинские буквы, которые выглядят как кириллические.
+HOMOGLYPHS = str.maketrans('aceopxykmthb', 'асеорхукмтнь')
+# Набор в английской раскладке вместо русской.
+KEYBOARD_LAYOUT = str.maketrans(
+    "qwertyuiop[]asdfghjkl;'zxcvbnm,.`",
+    'йцукенгшщзхъфывапролджэячсмитьбюё',
+)
+LATIN_RE = re.compile(r"[a-z\[\];',.`]")
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е')
+
+
+def fuzzy_variants(query):
+    """Варианты запроса: с заменой латинских двойников на кириллицу
+    и, если запрос целиком набран латиницей, в русской раскладке."""
+    query = query.casefold()
+    variants = {normalize(query.translate(HOMOGLYPHS))}
+    if LATIN_RE.search(query) and not CYRILLIC_RE.search(query):
+        variants.add(normalize(query.translate(KEYBOARD_LAYOUT)))
+    return variants
+
+
+def max_distance(word):
+    if len(word) <= 2:
+        return 0
+    if len(word) <= 4:
+        return 1
+    return INGREDIENT_FUZZY_MAX_DISTANCE
+
+
+def deletions(word, distance):
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {
+            variant[:index] + variant[index + 1:]
+            for variant in frontier
+            for index in range(len(variant))
+        }
+        variants |= frontier
+    return variants
+
+
+def edit_distance(source, target, limit):
+    """Расстояние Дамерау — Левенштейна (с перестановкой соседних букв);
+    всё, что больше limit, возвращается как limit + 1."""
+    if abs(len(source) - len(target)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(target) + 1))
+    for i, source_char in enumerate(source, 1):
+        current = [i]
+        for j, target_char in enumerate(target, 1):
+            value = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (source_char != target_char),
+            )
+            if (
+                before is not None and i > 1 and j > 1
+                and source_char == target[j - 2]
+                and source[i - 2] == target_char
+            ):
+                value = min(value, before[j - 2] + 1)
+            current.append(value)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def ngrams(text):
+    return {
+        text[index:index + NGRAM_SIZE]
+        for index in range(len(text) - NGRAM_SIZE + 1)
+    }
+
+
+class IngredientIndex:
+    def __init__(self, ingredients):
+        entries = sorted(
+            (normalize(item['name']), item['id'], item)
+            for item in ingredients
+        )
+        self.keys = [key for key, _, _ in entries]
+        self.items = [item for _, _, item in entries]
+        self.postings = defaultdict(list)
+        self.words = defaultdict(list)
+        self.word_counts = []
+        for position, key in enumerate(self.keys):
+            for gram in ngrams(key):
+                self.postings[gram].append(position)
+            words = WORD_RE.findall(key)
+            self.word_counts.append(len(words))
+            for word in set(words):
+                self.words[word].append(position)
+        self.deletions = defaultdict(set)
+        for word in self.words:
+            for variant in deletions(word, max_distance(word)):
+                self.deletions[variant].add(word)
+
+    @cached_property
+    def snapshot(self):
+        return CatalogSnapshot(self.items)
+
+    def search(self, query):
+        """Ингредиенты, название которых начинается с query или содержит
+        его; сначала совпадения по началу, внутри групп — по алфавиту."""
+        query = normalize(query)
+        if not query:
+            return self.items
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        contains = [
+            position for position in self.candidates(query)
+            if not start <= position < end and query in self.keys[position]
+        ]
+        return self.items[start:end] + [
+            self.items[position] for position in contains
+        ]
+
+    def candidates(self, query):
+        if len(query) < NGRAM_SIZE:
+            return range(len(self.keys))
+        postings = sorted(
+            (self.postings.get(gram, ()) for gram in ngrams(query)), key=len
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return sorted(candidates)
+
+    def fuzzy_search(self, query):
+        """Ближайшие по написанию ингредиенты: каждое слово запроса должно
+        совпасть со словом названия с точностью до нескольких опечаток.
+        Выше те, где меньше суммарное число правок и меньше лишних слов."""
+        scores = {}
+        for variant in fuzzy_variants(query):
+            for position, score in self.score_words(
+                WORD_RE.findall(variant)
+            ).items():
+                if score < scores.get(position, score + 1):
+                    scores[position] = score
+        ranked = sorted(
+            scores,
+            key=lambda position: (
+                scores[position], self.word_counts[position], position
+            ),
+        )
+        return [
+            self.items[position]
+            for position in ranked[:INGREDIENT_FUZZY_LIMIT]
+        ]
+
+    def score_words(self, query_words):
+        scores = None
+        for query_word in query_words:
+            limit = max_distance(query_word)
+            word_scores = {}
+            for word in self.similar_words(query_word, limit):
+                distance = edit_distance(query_word, word, limit)
+                if distance > limit:
+                    continue
+                for position in self.words[word]:
+                    if distance < word_scores.get(position, limit + 1):
+                        word_scores[position] = distance
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {
+                    position: scores[position] + distance
+                    for position, distance in word_scores.items()
+                    if position in scores
+                }
+            if not scores:
+                return {}
+        return scores or {}
+
+    def similar_words(self, query_word, limit):
+        words = set()
+        for variant in deletions(query_word, limit):
+            words |= self.deletions.get(variant, set())
+        return words
+
+
+ingredient_index = VersionedCatalog(
+    'ingredients',
+    lambda: IngredientIndex(
+        Ingredient.objects.values('id', 'name', 'measurement_unit')
+    ),
+)
@@ -0,0 +1,143 @@
+"""
+Множества id избранного, корзины и подписок пользователя.
+
+Каждый воркер держит отсортированные массивы id в LRU-кэше процесса.
+Актуальность проверяется по номеру версии в общем кэше: запись в любом
+воркере увеличивает версию, и остальные воркеры при следующем обращении
+перечитывают множество из базы. Воркер, сделавший запись, обновляет свой
+массив на месте, если его версия была последней.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.db import transaction
+
+from api.catalog import bump_version, get_versions
+from foodgram.constants import MEMBERSHIP_CACHE_MAX_ENTRIES
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+MEMBERSHIP_SOURCES = {
+    'favorites': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'recipe_id'),
+    'subscriptions': (Subscription, 'author_id'),
+}
+MEMBERSHIP_VERSION_KEY = 'membership:{}:{}'
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _version_key(kind, user_id):
+    return MEMBERSHIP_VERSION_KEY.format(kind, user_id)
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def _remember(key, version, ids):
+    with _lock:
+        _entries[key] = [version, ids]
+        _entries.move_to_end(key)
+        while len(_entries) > MEMBERSHIP_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def _load(kind, user_id):
+    model, field = MEMBERSHIP_SOURCES[kind]
+    return array('q', sorted(
+        model.objects.filter(user_id=user_id).values_list(field, flat=True)
+    ))
+
+
+def _current_versions(user_id):
+    keys = {_version_key(kind, user_id): kind for kind in MEMBERSHIP_SOURCES}
+    versions = get_versions(keys)
+    return {kind: versions.get(key) for key, kind in keys.items()}
+
+
+class UserMembership:
+    """Снимок множеств пользователя на время одного запроса."""
+
+    def __init__(self, user):
+        self.user_id = (
+            user.id if user is not None and user.is_authenticated else None
+        )
+        self._sets = {}
+
+    @classmethod
+    def for_request(cls, request):
+        if request is None:
+            return cls(None)
+        membership = getattr(request, '_membership', None)
+        if membership is None:
+            membership = cls(getattr(request, 'user', None))
+            request._membership = membership
+        return membership
+
+    def get(self, kind):
+        if self.user_id is None:
+            return array('q')
+        if not self._sets:
+            self._sets = self._resolve()
+        return self._sets[kind]
+
+    def _resolve(self):
+        sets = {}
+        for kind, version in _current_versions(self.user_id).items():
+            key = (kind, self.user_id)
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None:
+                    _entries.move_to_end(key)
+            if entry is not None and entry[0] == version:
+                sets[kind] = entry[1]
+                continue
+            ids = _load(kind, self.user_id)
+            _remember(key, version, ids)
+            sets[kind] = ids
+        return sets
+
+    def is_favorited(self, recipe_id):
+        return _contains(self.get('favorites'), recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return _contains(self.get('shopping_cart'), recipe_id)
+
+    def is_subscribed(self, author_id):
+        return _contains(self.get('subscriptions'), author_id)
+
+
+def _apply_change(kind, user_id, object_ids, added):
+    key = (kind, user_id)
+    version = bump_version(_version_key(kind, user_id))
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return
+        if version is None or entry[0] + 1 != version:
+            # Между нашей версией и новой были чужие записи.
+            del _entries[key]
+            return
+        ids = entry[1]
+        for object_id in object_ids:
+            index = bisect_left(ids, object_id)
+            present = index < len(ids) and ids[index] == object_id
+            if added and not present:
+                ids.insert(index, object_id)
+            elif not added and present:
+                del ids[index]
+        entry[0] = version
+
+
+def membership_changed(kind, user_id, object_ids, added):
+    """Регистрирует изменение множества после коммита транзакции."""
+    object_ids = list(object_ids)
+    if object_ids:
+        transaction.on_commit(
+            lambda: _apply_change(kind, user_id, object_ids, added)
+        )
@@ -1,8 +1,109 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from foodgram.constants import DEFAULT_PAGE_SIZE
 
 
 class RecipePagination(PageNumberPagination):
+    """
+    Постраничная пагинация с опциональным режимом курсора.
+
+    Параметр `cursor` (для первой страницы — пустой) включает keyset-режим:
+    выборка идёт по `cursor_ordering` вьюсета без COUNT(*) и OFFSET,
+    поэтому любая страница стоит столько же, сколько первая.
+    Без него работает прежний контракт `page`/`limit`.
+    """
+
     page_size = DEFAULT_PAGE_SIZE
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_position_filter(position)
+                )
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        last = self.page[-1]
+        position = [
+            str(getattr(last, field.lstrip('-'))) for field in self.ordering
+        ]
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position)
+        )
+
+    def get_position_filter(self, position):
+        """
+        Условие «строго после позиции» для составного ключа сортировки:
+        (a < x) OR (a = x AND b < y) для убывающих полей.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def encode_cursor(position):
+        raw = json.dumps(position, separators=(',', ':')).encode()
+        return urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            position = json.loads(raw)
+        except (BinasciiError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
@@ -0,0 +1,127 @@
+"""
+«Что приготовить»: рецепты, ранжированные по покрытию ингредиентами.
+
+Инвертированный индекс ингредиент -> отсортированный массив id рецептов
+(int32) хранится в памяти воркера. Для набора продуктов массивы
+склеиваются, и np.bincount за один проход считает, сколько ингредиентов
+каждого рецепта покрыто; вычитание из числа ингредиентов рецепта даёт
+недостающие. Запросов к базе при ранжировании нет.
+
+Индекс меняется на месте через VersionedCatalog.patch: одиночные строки
+RecipeIngredient учитывают сигналы, bulk_create в сериализаторе —
+явный вызов pantry_links_added (как и счётчики).
+"""
+import numpy as np
+
+from api.catalog import VersionedCatalog
+from recipes.models import RecipeIngredient
+
+EMPTY = np.empty(0, dtype=np.int32)
+
+
+class PantryIndex:
+    def __init__(self, rows):
+        pairs = np.fromiter(
+            (value for row in rows for value in row), dtype=np.int32
+        ).reshape(-1, 2)
+        # Сортировка по ингредиенту, затем по рецепту.
+        pairs = pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))]
+        recipe_ids, ingredient_ids = pairs[:, 0], pairs[:, 1]
+        bounds = np.flatnonzero(np.diff(ingredient_ids)) + 1
+        self.postings = {
+            int(chunk_ingredients[0]): chunk_recipes.copy()
+            for chunk_recipes, chunk_ingredients in zip(
+                np.split(recipe_ids, bounds),
+                np.split(ingredient_ids, bounds),
+            )
+            if len(chunk_ingredients)
+        }
+        self.totals = np.bincount(recipe_ids).astype(np.int32)
+
+    def add(self, recipe_id, ingredient_ids):
+        for ingredient_id in ingredient_ids:
+            posting = self.postings.get(ingredient_id, EMPTY)
+            index = np.searchsorted(posting, recipe_id)
+            if index < len(posting) and posting[index] == recipe_id:
+                continue
+            self.postings[ingredient_id] = np.insert(
+                posting, index, recipe_id
+            )
+            if recipe_id >= len(self.totals):
+                self.totals = np.concatenate((
+                    self.totals,
+                    np.zeros(
+                        max(recipe_id + 1, 2 * len(self.totals))
+                        - len(self.totals),
+                        dtype=np.int32,
+                    ),
+                ))
+            self.totals[recipe_id] += 1
+
+    def remove(self, recipe_id, ingredient_ids):
+        for ingredient_id in ingredient_ids:
+            posting = self.postings.get(ingredient_id, EMPTY)
+            index = np.searchsorted(posting, recipe_id)
+            if index == len(posting) or posting[index] != recipe_id:
+                continue
+            self.postings[ingredient_id] = np.delete(posting, index)
+            self.totals[recipe_id] -= 1
+
+    def rank(self, ingredient_ids, limit, max_missing=None):
+        """
+        [(id рецепта, покрыто, не хватает)] — сначала рецепты, которым
+        не хватает меньше ингредиентов, затем с большим покрытием,
+        затем новые.
+        """
+        postings = [
+            self.postings[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in self.postings
+        ]
+        if not postings:
+            return []
+        covered = np.bincount(
+            np.concatenate(postings), minlength=len(self.totals)
+        )
+        candidates = np.flatnonzero(covered)
+        matched = covered[candidates]
+        missing = self.totals[candidates] - matched
+        if max_missing is not None:
+            keep = missing <= max_missing
+            candidates, matched, missing = (
+                candidates[keep], matched[keep], missing[keep]
+            )
+        if len(candidates) > limit:
+            # Грубый отбор по недостающим, затем точная сортировка.
+            cutoff = np.partition(missing, limit - 1)[limit - 1]
+            keep = missing <= cutoff
+            candidates, matched, missing = (
+                candidates[keep], matched[keep], missing[keep]
+            )
+        order = np.lexsort((-candidates, -matched, missing))[:limit]
+        return [
+            (int(candidates[i]), int(matched[i]), int(missing[i]))
+            for i in order
+        ]
+
+
+pantry_index = VersionedCatalog(
+    'pantry',
+    lambda: PantryIndex(
+        RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator()
+    ),
+)
+
+
+def pantry_links_added(recipe_id, ingredient_ids):
+    ingredient_ids = list(ingredient_ids)
+    pantry_index.patch(lambda index: index.add(recipe_id, ingredient_ids))
+
+
+def pantry_links_removed(recipe_id, ingredient_ids):
+    ingredient_ids = list(ingredient_ids)
+    pantry_index.patch(
+        lambda index: index.remove(recipe_id, ingredient_ids)
+    )
@@ -0,0 +1,52 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import (
+    DataAndFiles, FileUploadParser, MultiPartParser
+)
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """
+    multipart/form-data, где поля объекта передаются JSON в части `data`,
+    а изображения — отдельными файловыми частями с именами полей.
+    Без части `data` поля формы берутся как есть.
+    """
+
+    json_field = 'data'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        if self.json_field not in parsed.data:
+            return parsed
+        try:
+            data = json.loads(parsed.data[self.json_field])
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        if not isinstance(data, dict):
+            raise ParseError('Часть data должна быть JSON-объектом.')
+        # Файлы кладутся прямо в данные: при слиянии обычного dict
+        # с MultiValueDict в Request.data попали бы списки значений.
+        # Закрывает их ImageUploadMixin.
+        data.update(parsed.files.dict())
+        return DataAndFiles(data, MultiValueDict())
+
+
+class ImageUploadParser(FileUploadParser):
+    """
+    Изображение телом запроса (Content-Type: image/...).
+    Файл кладётся в поле `upload_field` вьюсета.
+    """
+
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        field = getattr(parser_context['view'], 'upload_field', 'file')
+        return DataAndFiles({field: parsed.files['file']}, MultiValueDict())
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(
+            stream, media_type, parser_context
+        ) or 'upload'
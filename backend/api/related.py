@@ -0,0 +1,76 @@
+"""
+Пакетная загрузка связанных объектов при валидации.
+
+PrimaryKeyRelatedField делает отдельный SELECT на каждый id, и рецепт
+с тридцатью ингредиентами проверялся тридцатью запросами. Здесь
+сериализатор до валидации полей собирает id из входных данных,
+загружает объекты одним IN-запросом на модель и сразу сообщает обо
+всех несуществующих id; поля берут объекты из этого пакета.
+"""
+from rest_framework import serializers
+
+
+def parse_ids(values):
+    """Целые id из сырых значений; остальное оставляется полям."""
+    ids = set()
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Берёт объект из пакета корневого сериализатора, если он есть."""
+
+    def to_internal_value(self, data):
+        batch = getattr(self.root, 'related_batches', {}).get(
+            self.get_queryset().model
+        )
+        if batch is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            return batch[int(data)]
+        except (TypeError, ValueError):
+            return super().to_internal_value(data)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class BatchedRelatedMixin:
+    """
+    Загружает связанные объекты пакетами.
+
+    batched_related: {поле: (модель, ключ)}. Ключ None — поле содержит
+    список id, иначе список словарей с id под этим ключом.
+    """
+
+    batched_related = {}
+    missing_ids_message = 'Не найдены объекты с id: {ids}.'
+
+    def to_internal_value(self, data):
+        self.related_batches = {}
+        errors = {}
+        for field_name, (model, key) in self.batched_related.items():
+            values = data.get(field_name) if hasattr(data, 'get') else None
+            if not isinstance(values, list):
+                continue
+            if key is not None:
+                values = [
+                    item.get(key) for item in values
+                    if isinstance(item, dict)
+                ]
+            ids = parse_ids(values)
+            batch = self.related_batches.setdefault(model, {})
+            batch.update(model.objects.in_bulk(ids - batch.keys()))
+            missing = sorted(ids - batch.keys())
+            if missing:
+                errors[field_name] = [self.missing_ids_message.format(
+                    ids=', '.join(map(str, missing))
+                )]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return super().to_internal_value(data)
@@ -1,10 +1,23 @@
 from django.contrib.auth import get_user_model
+from django.db import models, transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from api.fragments import get_recipe_fragments, set_recipe_fragments
+from api.image_variants import variant_urls
+from api.membership import UserMembership
+from api.pantry import pantry_links_added
+from api.related import BatchedPrimaryKeyRelatedField, BatchedRelatedMixin
+from api.uploads import UploadableImageField
+from foodgram.constants import (
+    BULK_MAX_IDS, DEFAULT_PAGE_SIZE, PANTRY_MAX_INGREDIENTS,
+    PANTRY_MAX_RESULTS
+)
 from recipes.models import (
     Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
 )
+from recipes.counters import change_counters
+from recipes.services import lock_recipes, recipe_ingredients_changed
 from users.models import Subscription
 
 User = get_user_model()
@@ -38,7 +51,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 
 
 class IngredientAmountWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = BatchedPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(), source='ingredient'
     )
 
@@ -47,10 +60,85 @@ class IngredientAmountWriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массовых операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS,
+    )
+
+    def validate_ids(self, value):
+        if len(value) != len(set(value)):
+            raise serializers.ValidationError('id не должны повторяться.')
+        return value
+
+
+class PantrySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся продуктам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=PANTRY_MAX_INGREDIENTS,
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=PANTRY_MAX_RESULTS, default=DEFAULT_PAGE_SIZE
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+def wants_variants(request):
+    """
+    Копии изображений отдаются только по ?variants=1: в базовом
+    контракте API этих полей нет. Без запроса (фрагменты в кэше)
+    поле заполняется всегда.
+    """
+    return request is None or request.query_params.get('variants') in (
+        '1', 'true'
+    )
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии изображения из поля `image_field`."""
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        if not wants_variants(self.context.get('request')):
+            raise serializers.SkipField
+        return super().get_attribute(instance)
+
+    def to_representation(self, instance):
+        urls = variant_urls(
+            getattr(instance, self.image_field),
+            getattr(instance, f'{self.image_field}_variants'),
+        )
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return absolute_variant_urls(request, urls)
+
+
+def absolute_variant_urls(request, urls):
+    return {
+        name: {
+            fmt: request.build_absolute_uri(url)
+            for fmt, url in formats.items()
+        }
+        for name, formats in urls.items()
+    }
+
+
 class UserAvatarSerializer(serializers.ModelSerializer):
     """Сериализатор для обновления аватара пользователя."""
 
-    avatar = Base64ImageField(required=True)
+    avatar = UploadableImageField(required=True)
 
     class Meta:
         model = User
@@ -67,22 +155,22 @@ class UserSerializer(serializers.ModelSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False)
+    avatar_variants = ImageVariantsField('avatar')
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'avatar',
+            'is_subscribed', 'avatar', 'avatar_variants',
         )
         read_only_fields = ('is_subscribed',)
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = getattr(request, 'user', None)
-        return bool(
-            request and user and user.is_authenticated
-            and Subscription.objects.filter(user=user, author=obj).exists()
-        )
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return UserMembership.for_request(
+            self.context.get('request')
+        ).is_subscribed(obj.id)
 
 
 class SubscriptionCreateSerializer(serializers.ModelSerializer):
@@ -114,10 +202,11 @@ class SubscriptionCreateSerializer(serializers.ModelSerializer):
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = fields
 
     def to_representation(self, instance):
@@ -127,53 +216,181 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         return rep
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class PantryRecipeSerializer(ShortRecipeSerializer):
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(ShortRecipeSerializer.Meta):
+        fields = ShortRecipeSerializer.Meta.fields + ('matched', 'missing')
+        read_only_fields = fields
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, models.Manager) else data
+        )
+        return self.child.represent_many(recipes)
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """
+    Не зависящая от зрителя часть рецепта, которая хранится в кэше.
+
+    Рендерится без запроса в контексте, поэтому ссылки на изображения
+    получаются относительными, а флаг подписки на автора — ложным.
+    """
+
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientInRecipeSerializer(
         source='recipe_ingredients', many=True, read_only=True
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
+        fields = (
+            'id', 'author', 'tags', 'ingredients', 'name', 'image',
+            'image_variants', 'text', 'cooking_time'
+        )
+        read_only_fields = fields
+
+
+class RecipeReadSerializer(RecipeFragmentSerializer):
+    """
+    Рецепт для чтения: фрагмент из кэша плюс персональные флаги.
+
+    Связанные объекты подгружаются только для рецептов, которых
+    нет в кэше, поэтому вьюсету не нужен prefetch_related.
+    """
+
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+
+    class Meta(RecipeFragmentSerializer.Meta):
         fields = (
             'id', 'author', 'tags', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
         )
         read_only_fields = fields
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, recipe):
-        request = self.context.get('request')
-        user = getattr(request, 'user', None)
-        return bool(
-            request and user and user.is_authenticated
-            and Favorite.objects.filter(user=user, recipe=recipe).exists()
+    @staticmethod
+    def get_prefetch():
+        return (
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
         )
 
+    @property
+    def membership(self):
+        return UserMembership.for_request(self.context.get('request'))
+
+    def get_is_favorited(self, recipe):
+        return self.membership.is_favorited(recipe.id)
+
     def get_is_in_shopping_cart(self, recipe):
-        request = self.context.get('request')
-        user = getattr(request, 'user', None)
-        return bool(
-            request and user and user.is_authenticated
-            and ShoppingCart.objects.filter(user=user, recipe=recipe).exists()
-        )
+        return self.membership.is_in_shopping_cart(recipe.id)
 
     def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        if rep.get('image') is None:
-            rep['image'] = ''
-        return rep
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes):
+        fragments, generations = get_recipe_fragments(
+            [recipe.id for recipe in recipes]
+        )
+        missing = [
+            recipe.id for recipe in recipes if recipe.id not in fragments
+        ]
+        if missing:
+            # Рецепты перечитываются после того, как узнали поколения:
+            # фрагмент из данных до чужого коммита ляжет под старый ключ.
+            rendered = {
+                recipe.id: self.render_fragment(recipe)
+                for recipe in Recipe.objects.filter(
+                    id__in=missing
+                ).select_related('author').prefetch_related(
+                    *self.get_prefetch()
+                )
+            }
+            set_recipe_fragments(rendered, generations)
+            fragments.update(rendered)
+        # Рецепт, удалённый между запросами, отдаётся без кэширования.
+        gone = [recipe for recipe in recipes if recipe.id not in fragments]
+        if gone:
+            models.prefetch_related_objects(gone, *self.get_prefetch())
+            fragments.update(
+                (recipe.id, self.render_fragment(recipe)) for recipe in gone
+            )
+        return [
+            self.overlay(fragments[recipe.id], recipe) for recipe in recipes
+        ]
 
+    @staticmethod
+    def render_fragment(recipe):
+        fragment = RecipeFragmentSerializer().to_representation(recipe)
+        fragment['author'] = dict(fragment['author'])
+        fragment['tags'] = [dict(tag) for tag in fragment['tags']]
+        fragment['ingredients'] = [
+            dict(ingredient) for ingredient in fragment['ingredients']
+        ]
+        return dict(fragment)
+
+    def overlay(self, fragment, recipe):
+        variants = wants_variants(self.context.get('request'))
+        author = dict(
+            fragment['author'],
+            is_subscribed=self.membership.is_subscribed(recipe.author_id),
+            avatar=self.build_absolute_uri(fragment['author']['avatar']),
+            avatar_variants=self.build_absolute_variant_urls(
+                fragment['author']['avatar_variants']
+            ),
+        )
+        if not variants:
+            del author['avatar_variants']
+        values = dict(
+            fragment,
+            author=author,
+            is_favorited=self.get_is_favorited(recipe),
+            is_in_shopping_cart=self.get_is_in_shopping_cart(recipe),
+            image=self.build_absolute_uri(fragment['image']) or '',
+            image_variants=self.build_absolute_variant_urls(
+                fragment['image_variants']
+            ),
+        )
+        return {
+            field: values[field] for field in self.Meta.fields
+            if variants or field != 'image_variants'
+        }
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+    def build_absolute_uri(self, url):
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def build_absolute_variant_urls(self, urls):
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return absolute_variant_urls(request, urls)
+
+
+class RecipeWriteSerializer(BatchedRelatedMixin,
+                            serializers.ModelSerializer):
+    tags = BatchedPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
     ingredients = IngredientAmountWriteSerializer(many=True)
-    image = Base64ImageField(required=True)
+    image = UploadableImageField(required=True)
 
     class Meta:
         model = Recipe
@@ -182,6 +399,11 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    batched_related = {
+        'tags': (Tag, None),
+        'ingredients': (Ingredient, 'id'),
+    }
+
     def validate(self, data):
         tags = data.get('tags')
         ingredients = data.get('ingredients')
@@ -216,6 +438,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -224,19 +447,63 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
-        instance.tags.set(tags)
-        instance.recipe_ingredients.all().delete()
-        self.create_ingredients(instance, ingredients)
+        if ingredients is not None:
+            # Состав читается под блокировкой: параллельное добавление
+            # в корзину ждёт коммита и увидит уже новые количества.
+            lock_recipes([instance.id])
+        if tags is not None and {tag.id for tag in tags} != set(
+            instance.tags.values_list('id', flat=True)
+        ):
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         return RecipeReadSerializer(instance, context=self.context).data
 
+    @classmethod
+    def update_ingredients(cls, recipe, ingredients_data):
+        """Пишет только разницу с текущим составом рецепта."""
+        existing = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+        new_amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients_data
+        }
+        to_update = []
+        for ingredient_id, amount in new_amounts.items():
+            item = existing.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                to_update.append(item)
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            # Удаление через queryset отправляет post_delete по каждой
+            # строке: счётчики ингредиентов и фрагменты обновят сигналы.
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        RecipeIngredient.objects.bulk_update(to_update, ('amount',))
+        cls.create_ingredients(recipe, [
+            item for item in ingredients_data
+            if item['ingredient'].id not in existing
+        ])
+        recipe_ingredients_changed(recipe.id, old_amounts, new_amounts)
+
     @staticmethod
     def create_ingredients(recipe, ingredients_data):
+        if not ingredients_data:
+            return
         recipe_ingredients = [
             RecipeIngredient(
                 recipe=recipe,
@@ -246,6 +513,9 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             for ingredient_data in ingredients_data
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        ingredient_ids = [item.ingredient.id for item in recipe_ingredients]
+        change_counters(RecipeIngredient, ingredient_ids)
+        pantry_links_added(recipe.id, ingredient_ids)
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -292,20 +562,21 @@ class UserWithRecipesSerializer(UserSerializer):
     """Сериализатор пользователя с рецептами."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes(self, author):
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        queryset = author.recipes.all()
-        if limit and limit.isdigit():
-            queryset = queryset[: int(limit)]
+        # Страница подписок заранее подгружает последние рецепты авторов
+        # одним запросом с ROW_NUMBER() OVER (PARTITION BY author).
+        queryset = getattr(author, 'top_recipes', None)
+        if queryset is None:
+            request = self.context.get('request')
+            limit = request.query_params.get('recipes_limit')
+            queryset = author.recipes.all()
+            if limit and limit.isdigit():
+                queryset = queryset[: int(limit)]
         return ShortRecipeSerializer(
             queryset, many=True, context=self.context
         ).data
-
-    def get_recipes_count(self, author):
-        return author.recipes.count()
@@ -0,0 +1,96 @@
+"""
+Потоковая выгрузка списка покупок в текстовом, CSV и JSON форматах.
+
+Строки материализованного списка (ShoppingListItem) читаются серверным
+курсором и отдаются клиенту пачками, так что ни итоговый документ,
+ни весь результат запроса не собираются в памяти целиком.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+
+from foodgram.constants import SHOPPING_LIST_CHUNK_SIZE
+from recipes.models import ShoppingListItem
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_list_items(user):
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            'total_amount'
+        )
+        .order_by('ingredient__name')
+        .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+    )
+
+
+def render_txt(items):
+    separator = ''
+    for item in items:
+        yield (
+            f"{separator}{item['ingredient__name']} "
+            f"({item['ingredient__measurement_unit']}) — "
+            f"{item['total_amount']}"
+        )
+        separator = '\r\n'
+
+
+def render_csv(items):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total_amount'],
+        ))
+
+
+def render_json(items):
+    yield '['
+    for index, item in enumerate(items):
+        yield (',' if index else '') + json.dumps(
+            {
+                'name': item['ingredient__name'],
+                'measurement_unit': item['ingredient__measurement_unit'],
+                'amount': item['total_amount'],
+            },
+            ensure_ascii=False,
+        )
+    yield ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (render_txt, 'text/plain'),
+    'csv': (render_csv, 'text/csv'),
+    'json': (render_json, 'application/json'),
+}
+
+
+def _in_chunks(parts):
+    parts = iter(parts)
+    while chunk := list(islice(parts, SHOPPING_LIST_CHUNK_SIZE)):
+        yield ''.join(chunk)
+
+
+def shopping_list_response(user, file_format):
+    render, content_type = SHOPPING_LIST_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        _in_chunks(render(get_shopping_list_items(user))),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{file_format}"'
+    )
+    return response
@@ -0,0 +1,77 @@
+"""
+Карта коротких ссылок код -> id рецепта в памяти воркера.
+
+Новые коды выводятся из id (recipes.short_links), поэтому хранится
+только отсортированный массив id существующих рецептов; словари нужны
+лишь для старых случайных кодов. Карта полная, так что неизвестный код
+отсекается без запроса к базе — это и есть негативный кэш для ботов,
+перебирающих ссылки.
+"""
+from array import array
+from bisect import bisect_left
+
+from api.catalog import VersionedCatalog
+from recipes.models import Recipe
+from recipes.short_links import decode_short_link, encode_short_link
+
+
+class ShortLinkMap:
+    def __init__(self, rows):
+        ids = []
+        self.ids_by_code = {}
+        self.codes_by_id = {}
+        for code, recipe_id in rows:
+            if decode_short_link(code) == recipe_id:
+                ids.append(recipe_id)
+            else:
+                self.ids_by_code[code] = recipe_id
+                self.codes_by_id[recipe_id] = code
+        self.ids = array('q', sorted(ids))
+
+    def _has_id(self, recipe_id):
+        index = bisect_left(self.ids, recipe_id)
+        return index < len(self.ids) and self.ids[index] == recipe_id
+
+    def resolve(self, code):
+        recipe_id = decode_short_link(code)
+        if recipe_id is not None and self._has_id(recipe_id):
+            return recipe_id
+        return self.ids_by_code.get(code)
+
+    def code_for(self, recipe_id):
+        if self._has_id(recipe_id):
+            return encode_short_link(recipe_id)
+        return self.codes_by_id.get(recipe_id)
+
+    def add(self, recipe_id, code):
+        self.remove(recipe_id)
+        if decode_short_link(code) == recipe_id:
+            self.ids.insert(bisect_left(self.ids, recipe_id), recipe_id)
+        else:
+            self.ids_by_code[code] = recipe_id
+            self.codes_by_id[recipe_id] = code
+
+    def remove(self, recipe_id):
+        index = bisect_left(self.ids, recipe_id)
+        if index < len(self.ids) and self.ids[index] == recipe_id:
+            del self.ids[index]
+        code = self.codes_by_id.pop(recipe_id, None)
+        if code is not None:
+            del self.ids_by_code[code]
+
+
+short_link_map = VersionedCatalog(
+    'short-links',
+    lambda: ShortLinkMap(
+        Recipe.objects.filter(short_link__isnull=False)
+        .values_list('short_link', 'id').iterator()
+    ),
+)
+
+
+def short_link_added(recipe_id, code):
+    short_link_map.patch(lambda links: links.add(recipe_id, code))
+
+
+def short_link_removed(recipe_id):
+    short_link_map.patch(lambda links: links.remove(recipe_id))
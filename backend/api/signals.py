@@ -0,0 +1,257 @@
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from api.catalog import tag_catalog
+from api.fragments import invalidate_recipe_fragments
+from api.image_variants import schedule_variants
+from api.ingredient_search import ingredient_index
+from api.membership import membership_changed
+from api.pantry import pantry_index, pantry_links_added, pantry_links_removed
+from api.short_link_map import short_link_added, short_link_removed
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeSimilarity,
+    RecipeSimilarityState, ShoppingCart, Tag
+)
+from recipes.counters import COUNTERS, instance_counted
+from recipes.search import index_recipes, unindex_recipe
+from recipes.services import recipe_deleted
+from recipes.short_links import encode_short_link
+from users.models import Subscription
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.pk])
+
+
+@receiver(post_init, sender=Recipe)
+def remember_short_link(sender, instance, **kwargs):
+    # При .only() без поля исходный код неизвестен.
+    instance._stored_short_link = instance.__dict__.get('short_link')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_short_link_saved(sender, instance, created, raw=False,
+                            update_fields=None, **kwargs):
+    if raw or 'short_link' not in instance.__dict__:
+        return
+    if update_fields and 'short_link' not in update_fields:
+        return
+    # При создании код ещё не записан: Recipe.save выводит его из id.
+    code = instance.short_link or encode_short_link(instance.pk)
+    if created or code != instance._stored_short_link:
+        short_link_added(instance.pk, code)
+    instance._stored_short_link = code
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_short_link_deleted(sender, instance, **kwargs):
+    short_link_removed(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_saved(sender, instance, using, update_fields=None,
+                        **kwargs):
+    if update_fields and not {'name', 'text'} & update_fields:
+        return
+    index_recipes([(instance.pk, instance.name, instance.text)], using)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_search_deleted(sender, instance, using, **kwargs):
+    unindex_recipe(instance.pk, using)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance, 'image')
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance, 'avatar')
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted_from_carts(sender, instance, **kwargs):
+    # Строки корзины удалятся каскадом, поэтому вклад рецепта
+    # в списки покупок вычитается до удаления.
+    recipe_deleted(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted_from_similar(sender, instance, **kwargs):
+    # Строки похожих с этим рецептом удалятся каскадом, и списки, где он
+    # был, укоротятся. Без отпечатка build_recommendations пересчитает
+    # их при следующем запуске.
+    RecipeSimilarityState.objects.filter(
+        recipe_id__in=RecipeSimilarity.objects.filter(
+            similar_id=instance.pk
+        ).values('recipe_id')
+    ).delete()
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.recipe_id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, created, **kwargs):
+    if created:
+        pantry_links_added(instance.recipe_id, [instance.ingredient_id])
+    else:
+        # Прежний ингредиент строки неизвестен, индекс перестроится.
+        pantry_index.invalidate()
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    pantry_links_removed(instance.recipe_id, [instance.ingredient_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipe_fragments([instance.pk])
+    elif pk_set:
+        invalidate_recipe_fragments(pk_set)
+    else:
+        invalidate_recipe_fragments(
+            instance.recipes.values_list('id', flat=True)
+        )
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_catalog_changed(sender, **kwargs):
+    tag_catalog.invalidate()
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments(
+        Recipe.tags.through.objects.filter(
+            tag_id=instance.pk
+        ).values_list('recipe_id', flat=True)
+    )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_catalog_changed(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    invalidate_recipe_fragments(
+        instance.ingredient_recipes.values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    invalidate_recipe_fragments(
+        instance.recipes.values_list('id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def membership_added(sender, instance, created, **kwargs):
+    if created:
+        membership_changed(*_membership_args(instance), added=True)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def membership_removed(sender, instance, **kwargs):
+    membership_changed(*_membership_args(instance), added=False)
+
+
+def _membership_args(instance):
+    if isinstance(instance, Subscription):
+        return 'subscriptions', instance.user_id, [instance.author_id]
+    if isinstance(instance, Favorite):
+        return 'favorites', instance.user_id, [instance.recipe_id]
+    return 'shopping_cart', instance.user_id, [instance.recipe_id]
+
+
+def counted_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        instance_counted(instance, 1)
+
+
+def counted_removed(sender, instance, **kwargs):
+    instance_counted(instance, -1)
+
+
+for counted_model in COUNTERS:
+    post_save.connect(counted_added, sender=counted_model)
+    post_delete.connect(counted_removed, sender=counted_model)
+
+
+# Ссылки на файлы в хранилище по содержимому (foodgram.storage):
+# заменённое или удалённое изображение отпускается после коммита.
+MEDIA_FIELDS = {Recipe: 'image', User: 'avatar'}
+
+
+def remember_media(sender, instance, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    # При .only() без поля исходное имя неизвестно.
+    value = instance.__dict__.get(field)
+    instance._stored_media = getattr(value, 'name', value)
+
+
+def release_media(name):
+    if name:
+        transaction.on_commit(lambda: default_storage.delete(name))
+
+
+def media_uploading(sender, instance, raw=False, **kwargs):
+    # Несохранённый файл запишет FileField.pre_save уже после сигнала,
+    # и хранилище добавит ссылку, даже если имя блоба не изменится.
+    file = getattr(instance, MEDIA_FIELDS[sender])
+    instance._media_uploading = bool(file) and not (
+        raw or file._committed
+    )
+
+
+def media_saved(sender, instance, created, raw=False, **kwargs):
+    name = getattr(instance, MEDIA_FIELDS[sender]).name
+    previous = getattr(instance, '_stored_media', None)
+    uploaded = getattr(instance, '_media_uploading', False)
+    if not (created or raw) and previous and (
+        uploaded or previous != name
+    ):
+        release_media(previous)
+    instance._stored_media = name
+    instance._media_uploading = False
+
+
+def media_deleted(sender, instance, **kwargs):
+    release_media(getattr(instance, MEDIA_FIELDS[sender]).name)
+
+
+for media_model in MEDIA_FIELDS:
+    post_init.connect(remember_media, sender=media_model)
+    pre_save.connect(media_uploading, sender=media_model)
+    post_save.connect(media_saved, sender=media_model)
+    post_delete.connect(media_deleted, sender=media_model)
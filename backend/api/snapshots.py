@@ -0,0 +1,70 @@
+"""
+Готовые ответы для справочников, которые почти не меняются.
+
+JSON рендерится один раз на версию справочника и хранится сразу в сжатом
+виде (gzip и, если установлен пакет brotli, br) вместе с ETag по хэшу
+содержимого, так что ответ — это копирование байтов из памяти.
+"""
+import gzip
+from hashlib import sha256
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from foodgram.constants import CATALOG_SNAPSHOT_MAX_AGE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CatalogSnapshot:
+    content_type = 'application/json'
+
+    def __init__(self, data):
+        self.body = JSONRenderer().render(data)
+        # Слабый ETag: сжатые и несжатое представления эквивалентны.
+        self.etag = 'W/"{}"'.format(sha256(self.body).hexdigest()[:32])
+        self.encoded = {'gzip': gzip.compress(self.body, compresslevel=9)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(self.body)
+
+    def response(self, request):
+        if self.is_not_modified(request):
+            response = HttpResponseNotModified()
+        else:
+            encoding = self.choose_encoding(request)
+            response = HttpResponse(
+                self.encoded.get(encoding, self.body),
+                content_type=self.content_type,
+            )
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = self.etag
+        response['Cache-Control'] = (
+            f'public, max-age={CATALOG_SNAPSHOT_MAX_AGE}'
+        )
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    def is_not_modified(self, request):
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return False
+        etags = parse_etags(header)
+        return '*' in etags or self.etag.removeprefix('W/') in {
+            etag.removeprefix('W/') for etag in etags
+        }
+
+    def choose_encoding(self, request):
+        accepted = {
+            part.split(';')[0].strip()
+            for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')
+        }
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self.encoded:
+                return encoding
+        return None
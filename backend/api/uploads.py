@@ -0,0 +1,130 @@
+"""
+Потоковая загрузка изображений файлом вместо base64 в JSON.
+
+Тело запроса пишется кусками во временный файл, в памяти держится
+только текущий кусок. Размер и тип проверяются по заголовкам до чтения
+тела, сигнатура файла — по первому куску.
+"""
+import filetype
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException, UnsupportedMediaType
+from rest_framework.parsers import JSONParser
+
+from api.parsers import ImageUploadParser, MultiPartJSONParser
+
+from foodgram.constants import (
+    IMAGE_UPLOAD_CONTENT_TYPES,
+    IMAGE_UPLOAD_MAX_SIZE,
+)
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = (
+        f'Файл больше {IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)} МБ.'
+    )
+    default_code = 'upload_too_large'
+
+
+class CappedImageUploadHandler(TemporaryFileUploadHandler):
+    """Временный файл с ограничением размера и проверкой типа."""
+
+    max_size = IMAGE_UPLOAD_MAX_SIZE
+    # Запас на служебные части multipart и поле с JSON.
+    overhead = 64 * 1024
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.files = []
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length and content_length > self.max_size + self.overhead:
+            raise UploadTooLarge()
+
+    def new_file(self, field_name, file_name, content_type, content_length,
+                 charset=None, content_type_extra=None):
+        if content_type not in IMAGE_UPLOAD_CONTENT_TYPES:
+            raise UnsupportedMediaType(content_type)
+        if content_length and content_length > self.max_size:
+            raise UploadTooLarge()
+        super().new_file(
+            field_name, file_name, content_type, content_length,
+            charset, content_type_extra,
+        )
+        self.files.append(self.file)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.upload_interrupted()
+            raise UploadTooLarge()
+        if start == 0 and filetype.guess_mime(raw_data) not in (
+            IMAGE_UPLOAD_CONTENT_TYPES
+        ):
+            self.upload_interrupted()
+            raise UnsupportedMediaType(self.content_type)
+        return super().receive_data_chunk(raw_data, start)
+
+    def close(self):
+        for file in self.files:
+            # Сохранённый файл уже перемещён хранилищем.
+            try:
+                file.close()
+            except FileNotFoundError:
+                pass
+
+
+class ImageUploadMixin:
+    """
+    Действия из `upload_actions` принимают изображения файлом: multipart
+    (JSON в части `data`) или телом запроса. Загрузки идут через
+    CappedImageUploadHandler; остальные действия разбирают тело
+    парсерами по умолчанию.
+    """
+
+    upload_actions = ()
+    upload_parser_classes = (
+        JSONParser, MultiPartJSONParser, ImageUploadParser
+    )
+
+    def accepts_uploads(self):
+        # self.action ViewSetMixin выставляет только после
+        # initialize_request, а парсеры выбираются внутри него.
+        return self.action_map.get(
+            self.request.method.lower()
+        ) in self.upload_actions
+
+    def get_parsers(self):
+        if self.accepts_uploads():
+            return [parser() for parser in self.upload_parser_classes]
+        return super().get_parsers()
+
+    def initialize_request(self, request, *args, **kwargs):
+        if self.accepts_uploads():
+            request.upload_handlers = [CappedImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        for handler in request.upload_handlers:
+            if isinstance(handler, CappedImageUploadHandler):
+                handler.close()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class UploadableImageField(Base64ImageField):
+    """Изображение строкой base64 (старые клиенты) или загруженным файлом."""
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        # Имя файла выбирает сервер, как и для base64: по содержимому,
+        # а не по тому, что прислал клиент.
+        extension = filetype.guess_extension(data)
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        data.name = f'{self.get_file_name(None)}.{extension}'
+        # Pillow читает файл с диска, копию в памяти не создаём.
+        return serializers.ImageField.to_internal_value(self, data)
@@ -1,42 +1,70 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.bulk import (
+    bulk_add, bulk_remove, bulk_response_data, lock_user
+)
+from api.catalog import tag_catalog
+from api.filters import RecipeFilter
+from api.ingredient_search import ingredient_index
+from api.membership import membership_changed
+from api.pantry import pantry_index
 from api.pagination import RecipePagination
+from api.parsers import MultiPartJSONParser
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (
-    FavoriteSerializer, IngredientSerializer, RecipeReadSerializer,
-    RecipeWriteSerializer, ShoppingCartSerializer,
+    BulkIdsSerializer, FavoriteSerializer, IngredientSerializer,
+    PantryRecipeSerializer, PantrySerializer, RecipeReadSerializer,
+    RecipeWriteSerializer, ShoppingCartSerializer, ShortRecipeSerializer,
     SubscriptionCreateSerializer, TagSerializer, UserAvatarSerializer,
     UserWithRecipesSerializer
 )
+from api.short_link_map import short_link_map
+from api.shopping_list import SHOPPING_LIST_FORMATS, shopping_list_response
+from api.uploads import ImageUploadMixin
 from recipes.models import (
-    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+    Favorite, Ingredient, Recipe, RecipeSimilarity, ShoppingCart, Tag
+)
+from recipes.services import (
+    lock_recipes, recipes_added_to_cart, recipes_removed_from_cart
 )
 from users.models import Subscription
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+def get_bulk_ids(request):
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data['ids']
+
+
+class RecipeViewSet(ImageUploadMixin, viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = RecipePagination
+    upload_actions = ('create', 'update', 'partial_update')
+    upload_parser_classes = (JSONParser, MultiPartJSONParser)
+    cursor_ordering = ('-pub_date', '-id')
 
     def get_permissions(self):
         if self.request.method in SAFE_METHODS:
             return (AllowAny(),)
         return (IsAuthenticated(), IsAuthorOrReadOnly())
 
+    def get_queryset(self):
+        return Recipe.objects.select_related('author')
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeWriteSerializer
@@ -55,17 +83,21 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data={'user': user.id, 'recipe': recipe.id},
             context={'request': request}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_user(user)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
     def unfavorite(self, request, pk=None):
         user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        deleted_count, _ = Favorite.objects.filter(
-            user=user, recipe=recipe
-        ).delete()
+        with transaction.atomic():
+            lock_user(user)
+            deleted_count, _ = Favorite.objects.filter(
+                user=user, recipe=recipe
+            ).delete()
         if not deleted_count:
             return Response(
                 {"error": "Рецепт не найден в избранном."},
@@ -83,17 +115,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data={'user': user.id, 'recipe': recipe.id},
             context={'request': request}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_recipes([recipe.id])
+            lock_user(user)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            recipes_added_to_cart(user.id, [recipe.id])
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
     def remove_shopping_cart(self, request, pk=None):
         user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        deleted_count, _ = ShoppingCart.objects.filter(
-            user=user, recipe=recipe
-        ).delete()
+        with transaction.atomic():
+            lock_recipes([recipe.id])
+            lock_user(user)
+            deleted_count, _ = ShoppingCart.objects.filter(
+                user=user, recipe=recipe
+            ).delete()
+            if deleted_count:
+                recipes_removed_from_cart(user.id, [recipe.id])
         if not deleted_count:
             return Response(
                 {"error": "Рецепт не найден в корзине."},
@@ -101,34 +142,127 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_bulk(self, request):
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            statuses, created = bulk_add(
+                request.user, ids, Favorite, 'recipe', Recipe
+            )
+            membership_changed('favorites', request.user.id, created, True)
+        return Response(bulk_response_data(statuses))
+
+    @favorite_bulk.mapping.delete
+    def unfavorite_bulk(self, request):
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            statuses, _ = bulk_remove(request.user, ids, Favorite, 'recipe')
+        return Response(bulk_response_data(statuses))
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_bulk(self, request):
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            lock_recipes(ids)
+            statuses, created = bulk_add(
+                request.user, ids, ShoppingCart, 'recipe', Recipe
+            )
+            membership_changed(
+                'shopping_cart', request.user.id, created, True
+            )
+            recipes_added_to_cart(request.user.id, created)
+        return Response(bulk_response_data(statuses))
+
+    @shopping_cart_bulk.mapping.delete
+    def remove_shopping_cart_bulk(self, request):
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            lock_recipes(ids)
+            statuses, deleted = bulk_remove(
+                request.user, ids, ShoppingCart, 'recipe'
+            )
+            recipes_removed_from_cart(request.user.id, deleted)
+        return Response(bulk_response_data(statuses))
+
     @action(
         detail=False, methods=["get"], permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        cart_items = (
-            RecipeIngredient.objects
-            .filter(recipe__in_carts__user=user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
-
-        lines = [
-            f"{item['ingredient__name']} "
-            f"({item['ingredient__measurement_unit']}) — "
-            f"{item['total_amount']}"
-            for item in cart_items
-        ]
-        content = "\r\n".join(lines)
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'error': 'Формат должен быть одним из: {}.'.format(
+                    ', '.join(SHOPPING_LIST_FORMATS)
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return shopping_list_response(request.user, file_format)
 
-        response = HttpResponse(
-            content, content_type="text/plain; charset=utf-8"
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='what-to-cook',
+        permission_classes=[AllowAny],
+    )
+    def what_to_cook(self, request):
+        params = request.query_params
+        data = {
+            'ingredients': [
+                part for value in params.getlist('ingredients')
+                for part in value.split(',') if part
+            ],
+        }
+        for name in ('limit', 'max_missing'):
+            if name in params:
+                data[name] = params[name]
+        serializer = PantrySerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ranked = pantry_index.get().rank(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['limit'],
+            serializer.validated_data.get('max_missing'),
         )
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked]
         )
-        return response
+        results = []
+        for recipe_id, matched, missing in ranked:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched, recipe.missing = matched, missing
+                results.append(recipe)
+        return Response(PantryRecipeSerializer(
+            results, many=True, context={'request': request}
+        ).data)
+
+    @action(
+        detail=True, methods=['get'], permission_classes=[AllowAny]
+    )
+    def similar(self, request, pk=None):
+        # Список строит команда build_recommendations.
+        recipes = [
+            similarity.similar
+            for similarity in RecipeSimilarity.objects.filter(
+                recipe_id=pk
+            ).select_related('similar').order_by('-score')
+        ] if pk.isdigit() else []
+        if not recipes:
+            self.get_object()
+        return Response(ShortRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        ).data)
 
     @action(
         detail=True,
@@ -137,19 +271,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[AllowAny]
     )
     def get_link(self, request, pk=None):
-        recipe = self.get_object()
-        short_link = request.build_absolute_uri(f'/s/{recipe.short_link}/')
+        code = short_link_map.get().code_for(int(pk)) if pk.isdigit() else None
+        if code is None:
+            code = self.get_object().short_link
+        short_link = request.build_absolute_uri(f'/s/{code}/')
         return Response({'short-link': short_link})
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     permission_classes = (AllowAny,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        # Каталог и поиск по названию отдаются из индекса в памяти
+        # без запросов к базе.
+        index = ingredient_index.get()
+        name = request.query_params.get('name', '')
+        if not name:
+            return index.snapshot.response(request)
+        if request.query_params.get('fuzzy') in ('1', 'true'):
+            return Response(index.fuzzy_search(name))
+        return Response(index.search(name))
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
@@ -157,8 +302,15 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return tag_catalog.get().snapshot.response(request)
+
+
+class CustomUserViewSet(ImageUploadMixin, DjoserUserViewSet):
+    cursor_ordering = ('username', 'id')
+    upload_actions = ('avatar',)
+    upload_field = 'avatar'
 
-class CustomUserViewSet(DjoserUserViewSet):
     def get_permissions(self):
         if self.action in ('retrieve', 'list'):
             return [AllowAny()]
@@ -171,7 +323,27 @@ class CustomUserViewSet(DjoserUserViewSet):
         permission_classes=[IsAuthenticated],
     )
     def subscriptions(self, request):
-        authors = User.objects.filter(subscribers__user=request.user)
+        recipes = Recipe.objects.only(
+            'id', 'author_id', 'name', 'image', 'image_variants',
+            'cooking_time', 'pub_date',
+        )
+        limit = request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('pub_date').desc(), F('id').desc()),
+                )
+            ).filter(row_number__lte=int(limit))
+        authors = (
+            User.objects
+            .filter(subscribers__user=request.user)
+            .annotate(is_subscribed=Value(True))
+            .prefetch_related(
+                Prefetch('recipes', queryset=recipes, to_attr='top_recipes')
+            )
+        )
         page = self.paginate_queryset(authors)
         serializer = UserWithRecipesSerializer(
             page, many=True, context=self.get_serializer_context()
@@ -190,17 +362,21 @@ class CustomUserViewSet(DjoserUserViewSet):
             data={'user': user.id, 'author': author.id},
             context=self.get_serializer_context()
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_user(user)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, id=None):
         user = request.user
         author = get_object_or_404(User, id=id)
-        deleted_count, _ = Subscription.objects.filter(
-            user=user, author=author
-        ).delete()
+        with transaction.atomic():
+            lock_user(user)
+            deleted_count, _ = Subscription.objects.filter(
+                user=user, author=author
+            ).delete()
         if not deleted_count:
             return Response(
                 {'error': 'Подписка не найдена.'},
@@ -208,6 +384,34 @@ class CustomUserViewSet(DjoserUserViewSet):
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='subscribe',
+        url_name='subscribe-bulk',
+        permission_classes=[IsAuthenticated],
+    )
+    def subscribe_bulk(self, request):
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            statuses, created = bulk_add(
+                request.user, ids, Subscription, 'author', User,
+                forbidden={request.user.id},
+            )
+            membership_changed(
+                'subscriptions', request.user.id, created, True
+            )
+        return Response(bulk_response_data(statuses))
+
+    @subscribe_bulk.mapping.delete
+    def unsubscribe_bulk(self, request):
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            statuses, _ = bulk_remove(
+                request.user, ids, Subscription, 'author'
+            )
+        return Response(bulk_response_data(statuses))
+
     @action(
         detail=False,
         methods=['put'],
@@ -232,6 +436,7 @@ class CustomUserViewSet(DjoserUserViewSet):
     @avatar.mapping.delete
     def delete_avatar(self, request):
         user = request.user
-        user.avatar.delete()
+        # Файл отпускается сигналом после коммита (см. foodgram.storage).
+        user.avatar = None
         user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
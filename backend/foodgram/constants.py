@@ -27,3 +27,53 @@ USERNAME_VALIDATION_REGEX = r'^[\w.@+-]+$'
 
 # Пагинация
 DEFAULT_PAGE_SIZE = 6
+
+# Кэширование
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+MEMBERSHIP_CACHE_MAX_ENTRIES = 10000
+
+# Нечёткий поиск ингредиентов
+INGREDIENT_FUZZY_MAX_DISTANCE = 2
+INGREDIENT_FUZZY_LIMIT = 20
+
+# Снимки справочников (теги, ингредиенты)
+CATALOG_SNAPSHOT_MAX_AGE = 60 * 60
+
+# Выгрузка списка покупок
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+# Массовые операции с избранным, корзиной и подписками
+BULK_MAX_IDS = 100
+
+# Подбор рецептов по имеющимся продуктам
+PANTRY_MAX_INGREDIENTS = 500
+PANTRY_MAX_RESULTS = 100
+
+# Похожие рецепты: сколько хранить на рецепт, вес корзины относительно
+# избранного и размер плотного блока сходства (ячеек float64)
+RECOMMENDATIONS_TOP_K = 10
+RECOMMENDATIONS_CART_WEIGHT = 0.5
+RECOMMENDATIONS_BLOCK_CELLS = 8 * 1000 * 1000
+
+# Короткие ссылки на рецепты: 7 символов base62 (старые — 6 символов)
+SHORT_LINK_LENGTH = 7
+SHORT_LINK_MULTIPLIER = 2176477521739  # взаимно просто с 62 ** 7
+SHORT_LINK_OFFSET = 916132832
+
+# Загрузка изображений файлом (multipart или тело запроса)
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_CONTENT_TYPES = (
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp'
+)
+
+# Уменьшенные копии изображений: имя -> (длинная сторона, обрезка в квадрат)
+IMAGE_VARIANTS = {
+    'thumbnail': (160, True),
+    'card': (480, False),
+    'full': (1280, False),
+}
+IMAGE_VARIANTS_DIR = 'variants'
+IMAGE_VARIANT_WORKERS = 2
+
+# Хранилище медиафайлов по хешу содержимого
+MEDIA_BLOBS_DIR = 'blobs'
@@ -73,6 +73,18 @@ DATABASES = {
     }
 }
 
+# Общий кэш нужен, чтобы инвалидация из одного воркера gunicorn или
+# management-команды была видна остальным процессам. Без REDIS_URL
+# используется локальный кэш процесса; это допустимо только при DEBUG,
+# иначе воркер не запустится (foodgram/wsgi.py).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -152,3 +164,5 @@ if DEBUG:
 
 # WhiteNoise настройки для статики
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+DEFAULT_FILE_STORAGE = 'foodgram.storage.ContentAddressedStorage'
@@ -0,0 +1,79 @@
+"""
+Хранилище медиафайлов с адресацией по содержимому.
+
+Имя файла — sha256 содержимого, поэтому одинаковые загрузки хранятся
+один раз, а при изменении содержимого меняется и URL: nginx отдаёт такие
+файлы с Cache-Control: immutable. Число ссылок на файл хранится
+в recipes.MediaBlob: save() прибавляет ссылку, delete() убирает её
+и удаляет файл вместе с уменьшенными копиями, когда ссылок не осталось.
+"""
+import hashlib
+import os
+import shutil
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from foodgram.constants import IMAGE_VARIANTS_DIR, MEDIA_BLOBS_DIR
+
+
+def variants_dir(name):
+    """Каталог уменьшенных копий файла (см. api.image_variants)."""
+    return f'{IMAGE_VARIANTS_DIR}/{os.path.splitext(name)[0]}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{MEDIA_BLOBS_DIR}/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def blob_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return (
+            f'{MEDIA_BLOBS_DIR}/{digest[:2]}/{digest[2:4]}/'
+            f'{digest}{extension}'
+        )
+
+    def _save(self, name, content):
+        from recipes.models import MediaBlob
+
+        name = self.blob_name(name, content)
+        with transaction.atomic():
+            # Блокировка строки не даёт параллельному delete() удалить
+            # файл между проверкой его наличия и новой ссылкой.
+            MediaBlob.objects.select_for_update().get_or_create(name=name)
+            if not self.exists(name):
+                super()._save(name, content)
+            MediaBlob.objects.filter(name=name).update(
+                refcount=F('refcount') + 1
+            )
+        return name
+
+    def delete(self, name):
+        """Убирает одну ссылку; файлы вне хранилища блобов не трогает."""
+        from recipes.models import MediaBlob
+
+        if not is_blob(name):
+            return
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(
+                name=name
+            ).first()
+            if blob is None:
+                return
+            if blob.refcount > 1:
+                MediaBlob.objects.filter(name=name).update(
+                    refcount=F('refcount') - 1
+                )
+                return
+            # Файл удаляется до коммита: если коммит сорвётся, строка
+            # останется, и следующая такая же загрузка запишет файл заново.
+            super().delete(name)
+            shutil.rmtree(self.path(variants_dir(name)), ignore_errors=True)
+            blob.delete()
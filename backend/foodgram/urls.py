@@ -2,18 +2,22 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.contrib import admin
+from django.http import Http404
 from django.urls import include, path
-from django.shortcuts import redirect, get_object_or_404
-from recipes.models import Recipe
+from django.shortcuts import redirect
+from api.short_link_map import short_link_map
 
 
 def short_link_redirect(request, code):
     """
     Редирект с короткой ссылки вида /s/<code>/ на страницу рецепта.
+    Код ищется в карте коротких ссылок без запроса к базе.
     """
-    recipe = get_object_or_404(Recipe, short_link=code)
+    recipe_id = short_link_map.get().resolve(code)
+    if recipe_id is None:
+        raise Http404
     # Редирект на фронтовый роут SPA
-    target = f"/recipes/{recipe.id}"
+    target = f"/recipes/{recipe_id}"
     return redirect(target, permanent=False)
 
 
@@ -1,6 +1,28 @@
 import os
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# Версии справочников и членства живут в кэше: в локальном кэше
+# процесса воркеры не видят инвалидаций друг друга и management-команд
+# и бесконечно отдают устаревшие данные.
+if not settings.DEBUG and settings.CACHES['default']['BACKEND'] == (
+    'django.core.cache.backends.locmem.LocMemCache'
+):
+    raise ImproperlyConfigured(
+        'Без DEBUG нужен общий кэш: задайте REDIS_URL.'
+    )
+
+from api.short_link_map import short_link_map  # noqa: E402
+
+# Прогрев карты коротких ссылок при старте воркера; если база ещё
+# недоступна, карта соберётся при первом обращении.
+try:
+    short_link_map.get()
+except DatabaseError:
+    pass
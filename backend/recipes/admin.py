@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.db.models import Count
 from django.utils.html import format_html
 
 from recipes.models import (
@@ -9,6 +8,9 @@ from recipes.models import (
     RecipeIngredient,
     Favorite,
     ShoppingCart,
+    ShoppingListItem,
+    MediaBlob,
+    RecipeSimilarity,
 )
 
 
@@ -37,13 +39,14 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'cooking_time',
         'favorites_count',
+        'shopping_carts_count',
         'image_preview',
     )
     list_filter = ('author', 'tags')
     search_fields = ('name', 'author__username', 'author__email')
     autocomplete_fields = ('author', 'tags')
     inlines = (RecipeIngredientInline,)
-    readonly_fields = ('favorites_count',)
+    readonly_fields = ('favorites_count', 'shopping_carts_count')
     date_hierarchy = 'pub_date'
 
     def get_queryset(self, request):
@@ -52,13 +55,8 @@ class RecipeAdmin(admin.ModelAdmin):
             .get_queryset(request)
             .select_related('author')
             .prefetch_related('tags')
-            .annotate(favorites_count=Count('favorited_by', distinct=True))
         )
 
-    @admin.display(description='В избранном')
-    def favorites_count(self, obj):
-        return obj.favorites_count
-
     @admin.display(description='Фото')
     def image_preview(self, obj):
         if obj.image:
@@ -76,17 +74,6 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     list_filter = ('measurement_unit',)
 
-    def get_queryset(self, request):
-        return (
-            super()
-            .get_queryset(request)
-            .annotate(recipes_count=Count('ingredient_recipes', distinct=True))
-        )
-
-    @admin.display(description='Используется в рецептах')
-    def recipes_count(self, obj):
-        return obj.recipes_count
-
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
@@ -109,3 +96,26 @@ class ShoppingCartAdmin(UserRecipeAdminMixin, admin.ModelAdmin):
 @admin.register(Favorite)
 class FavoriteAdmin(UserRecipeAdminMixin, admin.ModelAdmin):
     pass
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'total_amount')
+    search_fields = ('user__username', 'user__email', 'ingredient__name')
+    autocomplete_fields = ('user', 'ingredient')
+    list_select_related = ('user', 'ingredient')
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'refcount')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'refcount')
+
+
+@admin.register(RecipeSimilarity)
+class RecipeSimilarityAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'similar', 'score')
+    search_fields = ('recipe__name',)
+    list_select_related = ('recipe', 'similar')
+    readonly_fields = ('recipe', 'similar', 'score')
@@ -0,0 +1,61 @@
+"""
+Денормализованные счётчики: избранное и корзины у рецепта, рецепты
+и подписчики у автора, использование ингредиента в рецептах.
+
+Счётчик меняется атомарным UPDATE ... SET field = field + n в той же
+транзакции, что и связь, поэтому параллельные запросы не теряют
+приращений. Одиночные строки учитываются сигналами (api.signals),
+bulk_create — явным вызовом change_counters. Расхождения исправляет
+команда reconcile_counters.
+"""
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart
+)
+from users.models import Subscription
+
+User = get_user_model()
+
+# Модель связи -> (модель со счётчиком, поле связи, поле счётчика).
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipe_id', 'shopping_carts_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscription: (User, 'author_id', 'subscribers_count'),
+    RecipeIngredient: (Ingredient, 'ingredient_id', 'recipes_count'),
+}
+
+
+def change_counters(model, target_ids, sign=1):
+    """Прибавляет sign к счётчику каждого id (с учётом повторов)."""
+    target_model, _, field = COUNTERS[model]
+    ids_by_delta = defaultdict(list)
+    for target_id, times in Counter(target_ids).items():
+        ids_by_delta[sign * times].append(target_id)
+    for delta, ids in ids_by_delta.items():
+        target_model.objects.filter(id__in=ids).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+
+
+def instance_counted(instance, sign):
+    _, link, _ = COUNTERS[type(instance)]
+    change_counters(type(instance), [getattr(instance, link)], sign)
+
+
+def counted_value(model):
+    """Подзапрос с фактическим значением счётчика для OuterRef('pk')."""
+    _, link, _ = COUNTERS[model]
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{link: OuterRef('pk')})
+            .order_by().values(link)
+            .annotate(total=Count('*')).values('total')
+        ),
+        Value(0),
+    )
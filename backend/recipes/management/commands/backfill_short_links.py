@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.short_link_map import short_link_map
+from recipes.models import Recipe
+from recipes.short_links import encode_short_link
+
+
+class Command(BaseCommand):
+    help = 'Заполняет короткие ссылки рецептов, у которых их нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько рецептов обновлять за одну транзакцию',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        recipes = Recipe.objects.filter(
+            short_link__isnull=True
+        ).order_by('id').only('id')
+        last_id = 0
+        filled = 0
+        while True:
+            batch = list(recipes.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for recipe in batch:
+                recipe.short_link = encode_short_link(recipe.id)
+            with transaction.atomic():
+                Recipe.objects.bulk_update(batch, ('short_link',))
+            filled += len(batch)
+        if filled:
+            short_link_map.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено коротких ссылок: {filled}'
+        ))
@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from foodgram.constants import (
+    RECOMMENDATIONS_BLOCK_CELLS, RECOMMENDATIONS_TOP_K
+)
+from recipes.similarity import Interactions
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет расчёт похожих рецептов на синтетическом избранном '
+        '(база не используется)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--favorites', type=int, default=1000 * 1000)
+        parser.add_argument('--users', type=int, default=100 * 1000)
+        parser.add_argument('--recipes', type=int, default=20 * 1000)
+        parser.add_argument(
+            '--changed', type=float, default=0.01,
+            help='Доля рецептов с изменившимся избранным для '
+                 'инкрементального пересчёта',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        # Популярность рецептов и активность пользователей по степенному
+        # закону, как у настоящего избранного.
+        recipe_weights = 1 / np.arange(1, options['recipes'] + 1) ** 0.8
+        user_weights = 1 / np.arange(1, options['users'] + 1) ** 0.5
+        users = rng.choice(
+            options['users'], options['favorites'],
+            p=user_weights / user_weights.sum(),
+        )
+        recipes = rng.choice(
+            options['recipes'], options['favorites'],
+            p=recipe_weights / recipe_weights.sum(),
+        )
+
+        started = time.perf_counter()
+        interactions = Interactions(users, recipes)
+        fingerprints = interactions.fingerprints()
+        self.report('Матрица и отпечатки', started, len(interactions))
+
+        size = len(interactions.recipe_ids)
+        started = time.perf_counter()
+        top = np.zeros((size, RECOMMENDATIONS_TOP_K), dtype=np.int64)
+        thresholds = np.zeros(size)
+        for chunk, similar, scores in interactions.top_similar(
+            np.arange(size), RECOMMENDATIONS_TOP_K,
+            RECOMMENDATIONS_BLOCK_CELLS,
+        ):
+            top[chunk] = similar
+            thresholds[chunk] = np.where(
+                scores[:, -1] > 0, scores[:, -1], 0
+            )
+        self.report('Полный расчёт', started, size)
+
+        # Инкрементальный расчёт по тем же правилам, что и
+        # build_recommendations: изменившиеся рецепты, рецепты, в чьих
+        # списках они были, и рецепты, куда они теперь попадают.
+        changed = rng.choice(
+            size, max(1, int(size * options['changed'])), replace=False
+        )
+        started = time.perf_counter()
+        entering = np.zeros(size, dtype=bool)
+        for _, block in interactions.similarity_blocks(
+            changed, RECOMMENDATIONS_BLOCK_CELLS
+        ):
+            entering |= (
+                (block > thresholds)
+                | ((block == thresholds) & (block > 0))
+            ).any(axis=0)
+            interactions.top_k(block, RECOMMENDATIONS_TOP_K)
+        listed = np.flatnonzero(np.isin(top, changed).any(axis=1))
+        neighbours = np.setdiff1d(
+            np.union1d(listed, np.flatnonzero(entering)), changed
+        )
+        for _ in interactions.top_similar(
+            neighbours, RECOMMENDATIONS_TOP_K, RECOMMENDATIONS_BLOCK_CELLS
+        ):
+            pass
+        self.report(
+            f'Инкрементальный расчёт ({len(changed)} изменилось, '
+            f'{len(neighbours)} соседей)', started,
+            len(changed) + len(neighbours),
+        )
+        self.stdout.write(
+            f'Блок сходства: {RECOMMENDATIONS_BLOCK_CELLS * 8 // 2 ** 20} '
+            f'МиБ, отпечатков: {len(fingerprints)}'
+        )
+
+    def report(self, title, started, count):
+        self.stdout.write(self.style.SUCCESS(
+            f'{title}: {time.perf_counter() - started:.2f} с ({count})'
+        ))
@@ -0,0 +1,205 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+
+from foodgram.constants import (
+    RECOMMENDATIONS_BLOCK_CELLS, RECOMMENDATIONS_CART_WEIGHT,
+    RECOMMENDATIONS_TOP_K
+)
+from recipes.models import (
+    Favorite, Recipe, RecipeSimilarity, RecipeSimilarityState, ShoppingCart
+)
+from recipes.similarity import Interactions
+
+# Не больше стольких id в одном IN (лимит параметров SQLite).
+ID_BATCH_SIZE = 1000
+
+
+def load_pairs(model):
+    pairs = np.fromiter(
+        (
+            value for row in model.objects.values_list(
+                'user_id', 'recipe_id'
+            ).iterator()
+            for value in row
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def batched(ids):
+    ids = list(ids)
+    for begin in range(0, len(ids), ID_BATCH_SIZE):
+        yield ids[begin:begin + ID_BATCH_SIZE]
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит похожие рецепты по совместному добавлению в избранное. '
+        'По умолчанию пересчитывает только рецепты, чьё избранное '
+        'изменилось с прошлого запуска, и их соседей'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты',
+        )
+        parser.add_argument(
+            '--with-carts', action='store_true',
+            help='Учитывать корзины с весом RECOMMENDATIONS_CART_WEIGHT',
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=RECOMMENDATIONS_TOP_K,
+            help='Сколько похожих рецептов хранить на рецепт',
+        )
+        parser.add_argument(
+            '--block-cells', type=int, default=RECOMMENDATIONS_BLOCK_CELLS,
+            help='Размер плотного блока сходства в ячейках (память)',
+        )
+
+    def handle(self, *args, **options):
+        users, recipes = load_pairs(Favorite)
+        weights = np.ones(len(users))
+        if options['with_carts']:
+            cart_users, cart_recipes = load_pairs(ShoppingCart)
+            users = np.concatenate((users, cart_users))
+            recipes = np.concatenate((recipes, cart_recipes))
+            weights = np.concatenate((weights, np.full(
+                len(cart_users), RECOMMENDATIONS_CART_WEIGHT
+            )))
+        interactions = Interactions(users, recipes, weights)
+        fingerprints = interactions.fingerprints()
+        stored = dict(RecipeSimilarityState.objects.values_list(
+            'recipe_id', 'fingerprint'
+        ))
+        # Рецепты, у которых больше нет ни одного пользователя. Удалённые
+        # рецепты сюда не попадают: их строки удаляются каскадом, а
+        # списки, где они были, теряют отпечаток (api.signals) и
+        # пересчитываются как изменившиеся.
+        gone = list(stored.keys() - set(interactions.recipe_ids.tolist()))
+        if options['full']:
+            dirty = np.arange(len(interactions.recipe_ids))
+        else:
+            dirty = np.flatnonzero([
+                stored.get(recipe_id) != fingerprint
+                for recipe_id, fingerprint in zip(
+                    interactions.recipe_ids.tolist(), fingerprints.tolist()
+                )
+            ])
+        # Рецепты, чьи списки могли измениться, хотя их избранное нет:
+        # в списке был изменившийся рецепт или изменившийся рецепт
+        # теперь не слабее последнего в списке. Сходство симметрично,
+        # поэтому второе видно по строкам изменившихся рецептов.
+        thresholds = self.load_thresholds(interactions, options['top_k'])
+        listed = interactions.index_of([
+            recipe_id
+            for ids in batched(
+                interactions.recipe_ids[dirty].tolist() + gone
+            )
+            for recipe_id in RecipeSimilarity.objects.filter(
+                similar_id__in=ids
+            ).order_by().values_list('recipe_id', flat=True).distinct()
+        ]) if len(dirty) < len(interactions.recipe_ids) else dirty
+        with transaction.atomic():
+            for ids in batched(gone):
+                RecipeSimilarity.objects.filter(recipe_id__in=ids).delete()
+                RecipeSimilarityState.objects.filter(
+                    recipe_id__in=ids
+                ).delete()
+        entering = np.zeros(len(interactions.recipe_ids), dtype=bool)
+        written = 0
+        for chunk, block in interactions.similarity_blocks(
+            dirty, options['block_cells']
+        ):
+            entering |= (
+                (block > thresholds)
+                | ((block == thresholds) & (block > 0))
+            ).any(axis=0)
+            written += self.store_chunk(
+                interactions, chunk,
+                *interactions.top_k(block, options['top_k']),
+            )
+        neighbours = np.setdiff1d(
+            np.union1d(listed, np.flatnonzero(entering)), dirty
+        )
+        for chunk, similar, scores in interactions.top_similar(
+            neighbours, options['top_k'], options['block_cells']
+        ):
+            written += self.store_chunk(interactions, chunk, similar, scores)
+        self.store_states(
+            interactions.recipe_ids[dirty], fingerprints[dirty]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пар пользователь — рецепт: {len(interactions)}, '
+            f'изменилось рецептов: {len(dirty)}, '
+            f'пересчитано: {len(dirty) + len(neighbours)}, '
+            f'записано похожих: {written}, удалено рецептов: {len(gone)}'
+        ))
+
+    @staticmethod
+    def load_thresholds(interactions, top_k):
+        """
+        Сходство последнего рецепта в сохранённых полных списках;
+        у неполных списков порог 0.
+        """
+        thresholds = np.zeros(len(interactions.recipe_ids))
+        full = RecipeSimilarity.objects.values('recipe_id').annotate(
+            total=Count('id'), lowest=Min('score')
+        ).filter(total__gte=top_k).values_list('recipe_id', 'lowest')
+        for recipe_id, lowest in full.iterator():
+            index = np.searchsorted(interactions.recipe_ids, recipe_id)
+            if (
+                index < len(interactions.recipe_ids)
+                and interactions.recipe_ids[index] == recipe_id
+            ):
+                thresholds[index] = lowest
+        return thresholds
+
+    @transaction.atomic
+    def store_chunk(self, interactions, chunk, similar, scores):
+        recipe_ids = interactions.recipe_ids[chunk]
+        similar_ids = interactions.recipe_ids[similar]
+        existing = set(Recipe.objects.filter(
+            id__in=np.union1d(recipe_ids, similar_ids.ravel()).tolist()
+        ).values_list('id', flat=True))
+        RecipeSimilarity.objects.filter(
+            recipe_id__in=recipe_ids.tolist()
+        ).delete()
+        rows = [
+            RecipeSimilarity(
+                recipe_id=recipe_id, similar_id=similar_id, score=score
+            )
+            for recipe_id, row_ids, row_scores in zip(
+                recipe_ids.tolist(), similar_ids.tolist(), scores.tolist()
+            )
+            for similar_id, score in zip(row_ids, row_scores)
+            if score > 0
+            and recipe_id in existing and similar_id in existing
+        ]
+        RecipeSimilarity.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+    @staticmethod
+    def store_states(recipe_ids, fingerprints):
+        for ids, values in zip(
+            batched(recipe_ids.tolist()), batched(fingerprints.tolist())
+        ):
+            with transaction.atomic():
+                existing = set(Recipe.objects.filter(
+                    id__in=ids
+                ).values_list('id', flat=True))
+                RecipeSimilarityState.objects.bulk_create(
+                    [
+                        RecipeSimilarityState(
+                            recipe_id=recipe_id, fingerprint=fingerprint
+                        )
+                        for recipe_id, fingerprint in zip(ids, values)
+                        if recipe_id in existing
+                    ],
+                    update_conflicts=True,
+                    unique_fields=('recipe',),
+                    update_fields=('fingerprint',),
+                )
@@ -0,0 +1,161 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodgram.constants import IMAGE_VARIANTS_DIR
+from foodgram.storage import is_blob
+from recipes.models import MediaBlob, Recipe
+
+User = get_user_model()
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+def walk_files(root):
+    """Файлы под root по одному, без построения полного списка."""
+    directories = [root]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path, entry.stat().st_mtime
+
+
+def source_names(name):
+    """Имена исходников, к которым может относиться файл."""
+    prefix = f'{IMAGE_VARIANTS_DIR}/'
+    if not name.startswith(prefix):
+        return (name,)
+    stem = os.path.dirname(name)[len(prefix):]
+    return tuple(stem + extension for extension in IMAGE_EXTENSIONS)
+
+
+def referenced_names(names):
+    return set(
+        Recipe.objects.filter(image__in=names).values_list('image', flat=True)
+    ) | set(
+        User.objects.filter(avatar__in=names).values_list('avatar', flat=True)
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT файлы, на которые не ссылается ни один '
+        'рецепт или аватар'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Не трогать файлы моложе стольких часов',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько имён проверять одним запросом',
+        )
+        parser.add_argument(
+            '--max-rate', type=float, default=0,
+            help='Не больше стольких удалений в секунду (0 — без ограничения)',
+        )
+        parser.add_argument(
+            '--quarantine', default=None,
+            help='Переносить файлы в этот каталог вместо удаления',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        root = settings.MEDIA_ROOT
+        deadline = time.time() - options['grace_hours'] * 60 * 60
+        checked = removed = 0
+        batch = []
+        if not os.path.isdir(root):
+            return
+        for path, mtime in walk_files(root):
+            checked += 1
+            if mtime > deadline:
+                continue
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            batch.append(name)
+            if len(batch) >= options['batch_size']:
+                removed += self.collect(batch)
+                batch = []
+                self.stdout.write(
+                    f'Проверено файлов: {checked}, сирот: {removed}'
+                )
+        if batch:
+            removed += self.collect(batch)
+        style = self.style.WARNING if options['dry_run'] else (
+            self.style.SUCCESS
+        )
+        self.stdout.write(style(
+            f'Проверено файлов: {checked}. '
+            f'{"Найдено" if options["dry_run"] else "Убрано"} '
+            f'сирот: {removed}'
+        ))
+
+    def find_orphans(self, names):
+        sources = {name: source_names(name) for name in names}
+        referenced = referenced_names(
+            [source for group in sources.values() for source in group]
+        )
+        return [
+            name for name, group in sources.items()
+            if referenced.isdisjoint(group)
+        ]
+
+    def collect(self, names):
+        orphans = self.find_orphans(names)
+        if not orphans or self.options['dry_run']:
+            for name in orphans:
+                self.stdout.write(f'  {name}')
+            return len(orphans)
+        with transaction.atomic():
+            # Блоб мог получить новую ссылку, пока шла проверка:
+            # хранилище берёт ту же блокировку при сохранении.
+            blobs = [name for name in orphans if is_blob(name)]
+            list(
+                MediaBlob.objects.select_for_update()
+                .filter(name__in=blobs).values_list('name')
+            )
+            orphans = self.find_orphans(orphans)
+            for name in orphans:
+                self.remove(name)
+            MediaBlob.objects.filter(
+                name__in=[name for name in orphans if is_blob(name)]
+            ).delete()
+        if self.options['max_rate']:
+            time.sleep(len(orphans) / self.options['max_rate'])
+        return len(orphans)
+
+    def remove(self, name):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        quarantine = self.options['quarantine']
+        try:
+            if quarantine:
+                target = os.path.join(quarantine, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            return
+        # Пустые каталоги убираются вверх до MEDIA_ROOT.
+        directory = os.path.dirname(path)
+        root = os.path.normpath(settings.MEDIA_ROOT)
+        while os.path.normpath(directory) != root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
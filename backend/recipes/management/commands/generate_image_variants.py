@@ -0,0 +1,49 @@
+from concurrent.futures import wait
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.image_variants import needs_variants, submit_variants
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нарезает уменьшенные копии изображений рецептов и аватаров, '
+        'для которых их ещё нет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help='Сколько записей обрабатывать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        for model, field in ((Recipe, 'image'), (User, 'avatar')):
+            submitted = self.generate(model, field, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.label}.{field}: обработано {submitted}'
+            ))
+
+    def generate(self, model, field, chunk_size):
+        rows = (
+            model.objects.exclude(**{field: ''})
+            .exclude(**{f'{field}__isnull': True})
+            .order_by('id').only('id', field, f'{field}_variants')
+        )
+        last_id = 0
+        submitted = 0
+        while True:
+            chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                return submitted
+            last_id = chunk[-1].id
+            futures = [
+                submit_variants(model, obj.pk, field, getattr(obj, field).name)
+                for obj in chunk if needs_variants(obj, field)
+            ]
+            wait(futures)
+            submitted += len(futures)
@@ -2,6 +2,8 @@ import json
 from pathlib import Path
 
 from django.core.management.base import BaseCommand, CommandError
+
+from api.ingredient_search import ingredient_index
 from recipes.models import Ingredient
 
 
@@ -84,6 +86,9 @@ class Command(BaseCommand):
             ingredients_to_create, ignore_conflicts=True
         )
         after = Ingredient.objects.count()
+        # bulk_create не отправляет сигналы, поэтому индекс поиска
+        # сбрасываем явно.
+        ingredient_index.invalidate()
         created = after - before
 
         self.stdout.write(
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает полнотекстовый индекс рецептов (SQLite FTS5); '
+        'в PostgreSQL индекс обновляется самой базой'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько рецептов индексировать за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_search_index(
+                Recipe.objects.order_by('id'),
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {total}'
+        ))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from recipes.counters import COUNTERS, counted_value
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики (избранное, корзины, '
+        'рецепты, подписчики, использование ингредиентов) и исправляет '
+        'расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько строк обрабатывать за одну транзакцию',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        style = self.style.WARNING if options['dry_run'] else (
+            self.style.SUCCESS
+        )
+        for model, (target_model, _, field) in COUNTERS.items():
+            checked, fixed = self.reconcile_counter(
+                model, target_model, field,
+                options['chunk_size'], options['dry_run'],
+            )
+            self.stdout.write(style(
+                f'{target_model._meta.label}.{field}: '
+                f'проверено {checked}, '
+                f'{"найдено" if options["dry_run"] else "исправлено"} '
+                f'{fixed}'
+            ))
+
+    def reconcile_counter(self, model, target_model, field, chunk_size,
+                          dry_run):
+        ids = target_model.objects.order_by('id').values_list('id', flat=True)
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            chunk = list(ids.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            checked += len(chunk)
+            fixed += self.reconcile_chunk(
+                model, target_model, field, chunk, dry_run
+            )
+        return checked, fixed
+
+    @transaction.atomic
+    def reconcile_chunk(self, model, target_model, field, chunk, dry_run):
+        wrong = list(
+            target_model.objects.select_for_update()
+            .filter(id__in=chunk)
+            .annotate(expected=counted_value(model))
+            .exclude(**{field: F('expected')})
+            .only('id', field)
+        )
+        for obj in wrong:
+            setattr(obj, field, obj.expected)
+        if not dry_run:
+            target_model.objects.bulk_update(wrong, (field,))
+        return len(wrong)
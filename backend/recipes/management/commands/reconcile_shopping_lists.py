@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingListItem
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает материализованные списки покупок по корзинам '
+        'и исправляет расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Сколько пользователей обрабатывать за одну транзакцию',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        users = User.objects.order_by('id').values_list('id', flat=True)
+        last_id = 0
+        fixed = checked = 0
+        while True:
+            user_ids = list(users.filter(id__gt=last_id)[:chunk_size])
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            checked += len(user_ids)
+            fixed += self.reconcile(user_ids, dry_run)
+        style = self.style.WARNING if dry_run else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Проверено пользователей: {checked}. '
+            f'{"Найдено" if dry_run else "Исправлено"} позиций: {fixed}'
+        ))
+
+    @transaction.atomic
+    def reconcile(self, user_ids, dry_run):
+        list(
+            User.objects.select_for_update()
+            .filter(id__in=user_ids).order_by('id').values_list('id')
+        )
+        expected = {
+            (row['recipe__in_carts__user_id'], row['ingredient_id']):
+                row['total']
+            for row in RecipeIngredient.objects
+            .filter(recipe__in_carts__user_id__in=user_ids)
+            .values('recipe__in_carts__user_id', 'ingredient_id')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        }
+        to_update, to_delete = [], []
+        for item in ShoppingListItem.objects.filter(user_id__in=user_ids):
+            total = expected.pop((item.user_id, item.ingredient_id), None)
+            if total is None:
+                to_delete.append(item.id)
+            elif total != item.total_amount:
+                item.total_amount = total
+                to_update.append(item)
+        to_create = [
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id,
+                total_amount=total,
+            )
+            for (user_id, ingredient_id), total in expected.items()
+        ]
+        if not dry_run:
+            ShoppingListItem.objects.bulk_create(to_create)
+            ShoppingListItem.objects.bulk_update(
+                to_update, ('total_amount',)
+            )
+            ShoppingListItem.objects.filter(id__in=to_delete).delete()
+        return len(to_create) + len(to_update) + len(to_delete)
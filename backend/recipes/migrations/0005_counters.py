@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:17
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+# (модель со счётчиком, поле счётчика, модель связи, поле связи)
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'shopping_carts_count', 'ShoppingCart', 'recipe'),
+    ('users', 'CustomUser', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'CustomUser', 'subscribers_count', 'Subscription', 'author'),
+    ('recipes', 'Ingredient', 'recipes_count', 'RecipeIngredient',
+     'ingredient'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app_label, target_name, field, model_name, link in COUNTERS:
+        target = apps.get_model(app_label, target_name)
+        model = apps.get_model(
+            'users' if model_name == 'Subscription' else 'recipes',
+            model_name,
+        )
+        target.objects.update(**{field: Coalesce(
+            models.Subquery(
+                model.objects.filter(**{link: models.OuterRef('pk')})
+                .order_by().values(link)
+                .annotate(total=models.Count('*')).values('total')
+            ),
+            models.Value(0),
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistitem'),
+        ('users', '0002_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Используется в рецептах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
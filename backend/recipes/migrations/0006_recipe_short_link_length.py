@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.CharField(blank=True, max_length=7, null=True, unique=True, verbose_name='Короткая ссылка'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+import re
+
+from django.db import migrations
+
+# Копия определений из recipes.search на момент миграции: миграция
+# не должна меняться вместе с живым кодом.
+SEARCH_TABLE = 'recipes_recipe_search'
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A')"
+    " || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+)
+WORD_RE = re.compile(r'\w+')
+BATCH_SIZE = 1000
+
+
+def fill_index(recipes, cursor):
+    import snowballstemmer
+
+    stemmer = snowballstemmer.stemmer('russian')
+
+    def stemmed(text):
+        words = WORD_RE.findall((text or '').casefold().replace('ё', 'е'))
+        return ' '.join(stemmer.stemWords(words))
+
+    batch = []
+    for pk, name, text in recipes.values_list(
+        'id', 'name', 'text'
+    ).iterator():
+        batch.append((pk, stemmed(name), stemmed(text)))
+        if len(batch) == BATCH_SIZE:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) '
+                f'VALUES (%s, %s, %s)',
+                batch,
+            )
+            batch = []
+    if batch:
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)',
+            batch,
+        )
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    Recipe = apps.get_model('recipes', 'Recipe')
+    if vendor == 'postgresql':
+        # Индекс по выражению база обновляет сама, заполнять нечего.
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_idx '
+            f'ON {Recipe._meta.db_table} '
+            f'USING gin (({POSTGRES_VECTOR}))'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+            f'USING fts5(name, text, tokenize="unicode61")'
+        )
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            fill_index(
+                Recipe.objects.using(schema_editor.connection.alias), cursor
+            )
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_TABLE}_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_mediablob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
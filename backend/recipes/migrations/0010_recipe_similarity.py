@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSimilarityState',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similarity_state', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('fingerprint', models.BigIntegerField(verbose_name='Отпечаток')),
+            ],
+            options={
+                'verbose_name': 'Состояние рекомендаций',
+                'verbose_name_plural': 'Состояния рекомендаций',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='recipes.recipe', verbose_name='Рецепт')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='Похожий рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+                'ordering': ('-score',),
+                'indexes': [models.Index(fields=['recipe', '-score'], name='recipe_similarity_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipesimilarity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'similar'), name='unique_recipe_similarity'),
+        ),
+    ]
@@ -1,6 +1,3 @@
-import random
-import string
-
 from django.contrib.auth import get_user_model
 from django.core.validators import (
     MinValueValidator,
@@ -19,7 +16,9 @@ from foodgram.constants import (
     RECIPE_MAX_PREP_MINUTES,
     INGREDIENT_AMOUNT_MAX,
     INGREDIENT_AMOUNT_MIN,
+    SHORT_LINK_LENGTH,
 )
+from recipes.short_links import encode_short_link
 
 User = get_user_model()
 
@@ -58,6 +57,9 @@ class Ingredient(models.Model):
         max_length=INGREDIENT_MEASUREMENT_MAX_LEN,
         verbose_name='Единица измерения',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Используется в рецептах'
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -90,6 +92,12 @@ class Recipe(models.Model):
         upload_to=RECIPE_IMAGE_STORAGE_PATH,
         verbose_name='Изображение рецепта'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения',
+    )
     text = models.TextField(verbose_name='Инструкция по приготовлению')
     cooking_time = models.PositiveSmallIntegerField(
         validators=[
@@ -121,7 +129,17 @@ class Recipe(models.Model):
         verbose_name='Ингредиенты',
     )
     short_link = models.CharField(
-        max_length=6, unique=True, blank=True, null=True
+        max_length=SHORT_LINK_LENGTH,
+        unique=True,
+        blank=True,
+        null=True,
+        verbose_name='Короткая ссылка',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном'
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В корзинах'
     )
 
     class Meta:
@@ -129,26 +147,23 @@ class Recipe(models.Model):
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} (автор: {self.author.username})'
 
     def save(self, *args, **kwargs):
-        if not self.short_link:
-            self.generate_short_link()
         super().save(*args, **kwargs)
-
-    def generate_short_link(self):
-        characters = string.ascii_letters + string.digits
-        while True:
-            short_link = ''.join(
-                random.choice(characters) for _ in range(6)
+        if not self.short_link:
+            # Код выводится из id, поэтому присваивается после вставки.
+            self.short_link = encode_short_link(self.pk)
+            Recipe.objects.filter(pk=self.pk).update(
+                short_link=self.short_link
             )
-            if not Recipe.objects.filter(
-                short_link=short_link
-            ).exists():
-                self.short_link = short_link
-                break
 
 
 class RecipeIngredient(models.Model):
@@ -256,3 +271,126 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} -> {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Итог списка покупок пользователя по одному ингредиенту.
+
+    Поддерживается при изменении корзины и состава рецептов
+    (см. recipes.services), расхождения исправляет команда
+    reconcile_shopping_lists.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} — {self.total_amount}'
+
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище по хешу содержимого (foodgram.storage) и число
+    ссылок на него из изображений рецептов и аватаров.
+    """
+
+    name = models.CharField(
+        max_length=100, primary_key=True, verbose_name='Имя файла'
+    )
+    refcount = models.PositiveIntegerField(
+        default=0, verbose_name='Число ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Похожий рецепт по совместному добавлению в избранное. Заполняется
+    командой build_recommendations, по RECOMMENDATIONS_TOP_K на рецепт.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('-score',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_recipe_similarity'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'),
+                name='recipe_similarity_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar} ({self.score:.3f})'
+
+
+class RecipeSimilarityState(models.Model):
+    """
+    Отпечаток набора пользователей, добавивших рецепт, на момент
+    последнего расчёта похожих: по нему build_recommendations находит
+    рецепты, которые нужно пересчитать.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='similarity_state',
+        verbose_name='Рецепт',
+    )
+    fingerprint = models.BigIntegerField(verbose_name='Отпечаток')
+
+    class Meta:
+        verbose_name = 'Состояние рекомендаций'
+        verbose_name_plural = 'Состояния рекомендаций'
+
+    def __str__(self):
+        return f'{self.recipe} ({self.fingerprint})'
@@ -0,0 +1,150 @@
+"""
+Полнотекстовый поиск рецептов по названию и описанию.
+
+PostgreSQL: выражение tsvector с конфигурацией russian и GIN-индекс
+по этому же выражению (миграция 0009), так что индекс обновляет сама
+база, а запрос с @@ идёт по нему.
+
+SQLite: таблица FTS5 с rowid = id рецепта. Встроенные токенизаторы FTS5
+русский не стеммируют, поэтому в таблицу пишутся уже приведённые
+к основе слова (Snowball), а запрос стеммируется так же. Таблицу
+обновляют сигналы сохранения и удаления рецепта.
+
+Совпадение в названии весит больше, чем в описании.
+"""
+import re
+
+import snowballstemmer
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Recipe
+
+SEARCH_TABLE = 'recipes_recipe_search'
+SEARCH_CONFIG = 'russian'
+# Веса bm25 для столбцов name и text (SQLite).
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('{config}', coalesce({prefix}name, '')), 'A')"
+    " || "
+    "setweight(to_tsvector('{config}', coalesce({prefix}text, '')), 'B')"
+)
+POSTGRES_QUERY = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+
+WORD_RE = re.compile(r'\w+')
+stemmer = snowballstemmer.stemmer(SEARCH_CONFIG)
+
+
+def stem_words(text):
+    words = WORD_RE.findall((text or '').casefold().replace('ё', 'е'))
+    return stemmer.stemWords(words)
+
+
+def vendor(using):
+    return connections[using].vendor
+
+
+def postgres_vector(prefix=''):
+    # Индекс строится по тому же выражению, иначе планировщик его
+    # не использует; имя таблицы на совпадение не влияет.
+    return POSTGRES_VECTOR.format(config=SEARCH_CONFIG, prefix=prefix)
+
+
+def search_recipes(queryset, value):
+    """Рецепты, подходящие под запрос, с рангом в search_rank."""
+    table = Recipe._meta.db_table
+    if vendor(queryset.db) == 'postgresql':
+        vector = postgres_vector(f'{table}.')
+        queryset = queryset.filter(RawSQL(
+            f'({vector}) @@ {POSTGRES_QUERY}', (value,),
+            output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank({vector}, {POSTGRES_QUERY})', (value,),
+            output_field=FloatField(),
+        ))
+    else:
+        words = stem_words(value)
+        if not words:
+            return queryset.none()
+        # Последнее слово может быть недописанным.
+        match = ' '.join(f'"{word}"' for word in words) + '*'
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s', (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({SEARCH_TABLE}, %s, %s) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id',
+            (NAME_WEIGHT, TEXT_WEIGHT, match),
+            output_field=FloatField(),
+        ))
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
+
+
+def create_search_index(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_idx '
+            f'ON {Recipe._meta.db_table} '
+            f'USING gin (({postgres_vector()}))'
+        )
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+            f'USING fts5(name, text, tokenize="unicode61")'
+        )
+
+
+def drop_search_index(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_TABLE}_idx')
+    elif schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def index_recipes(rows, using='default'):
+    """Записывает (id, name, text) в таблицу FTS5; вне SQLite ничего."""
+    if vendor(using) != 'sqlite':
+        return
+    rows = [
+        (pk, ' '.join(stem_words(name)), ' '.join(stem_words(text)))
+        for pk, name, text in rows
+    ]
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+            [(pk,) for pk, _, _ in rows],
+        )
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)',
+            rows,
+        )
+
+
+def unindex_recipe(recipe_id, using='default'):
+    if vendor(using) != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', (recipe_id,)
+        )
+
+
+def rebuild_search_index(recipes, using='default', batch_size=1000):
+    """Заново заполняет таблицу FTS5 из queryset рецептов."""
+    if vendor(using) != 'sqlite':
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    total = 0
+    batch = []
+    for row in recipes.values_list('id', 'name', 'text').iterator():
+        batch.append(row)
+        if len(batch) == batch_size:
+            index_recipes(batch, using)
+            total += len(batch)
+            batch = []
+    index_recipes(batch, using)
+    return total + len(batch)
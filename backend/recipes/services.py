@@ -0,0 +1,116 @@
+"""
+Поддержка материализованного списка покупок (ShoppingListItem).
+
+Все изменения сводятся к набору дельт {(user_id, ingredient_id): amount}
+и применяются в одной транзакции. Строки пользователей блокируются
+в фиксированном порядке, поэтому параллельные изменения одной корзины
+не теряют обновлений и не упираются в уникальный индекс.
+
+Изменение корзины и изменение состава рецепта читают данные друг друга
+(состав и корзины с рецептом соответственно), поэтому оба сначала
+блокируют строки рецептов через lock_recipes. Порядок всегда один:
+рецепты, затем пользователи.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from recipes.models import (
+    Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem
+)
+
+User = get_user_model()
+
+
+@transaction.atomic
+def apply_shopping_list_deltas(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    user_ids = sorted({user_id for user_id, _ in deltas})
+    list(
+        User.objects.select_for_update()
+        .filter(id__in=user_ids).order_by('id').values_list('id')
+    )
+    existing = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in={ingredient_id for _, ingredient_id in deltas},
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for (user_id, ingredient_id), delta in deltas.items():
+        item = existing.get((user_id, ingredient_id))
+        if item is None:
+            if delta > 0:
+                to_create.append(ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=delta,
+                ))
+            continue
+        item.total_amount += delta
+        if item.total_amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.id)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ('total_amount',))
+    ShoppingListItem.objects.filter(id__in=to_delete).delete()
+
+
+def lock_recipes(recipe_ids):
+    """Блокирует рецепты до конца транзакции; вызывать до lock_user."""
+    list(
+        Recipe.objects.select_for_update()
+        .filter(id__in=recipe_ids).order_by('id').values_list('id')
+    )
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def recipes_added_to_cart(user_id, recipe_ids, sign=1):
+    deltas = defaultdict(int)
+    for ingredient_id, amount in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', 'amount'):
+        deltas[user_id, ingredient_id] += sign * amount
+    apply_shopping_list_deltas(deltas)
+
+
+def recipes_removed_from_cart(user_id, recipe_ids):
+    recipes_added_to_cart(user_id, recipe_ids, sign=-1)
+
+
+def recipe_ingredients_changed(recipe_id, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки всех пользователей,
+    у которых рецепт лежит в корзине."""
+    changes = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    apply_shopping_list_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True)
+        for ingredient_id, delta in changes.items()
+    })
+
+
+def recipe_deleted(recipe_id):
+    lock_recipes([recipe_id])
+    recipe_ingredients_changed(recipe_id, get_recipe_amounts(recipe_id), {})
@@ -0,0 +1,48 @@
+"""
+Короткие ссылки на рецепты.
+
+Код — base62 от аффинной перестановки id по модулю 62 ** 7:
+отображение взаимно однозначное, поэтому коды не повторяются
+и не требуют проверки в базе, а соседние id не дают похожих кодов.
+Новые коды длиннее старых случайных (6 символов) и не пересекаются с ними.
+"""
+import string
+
+from foodgram.constants import (
+    SHORT_LINK_LENGTH,
+    SHORT_LINK_MULTIPLIER,
+    SHORT_LINK_OFFSET,
+)
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+MODULUS = BASE ** SHORT_LINK_LENGTH
+INVERSE = pow(SHORT_LINK_MULTIPLIER, -1, MODULUS)
+POSITIONS = {char: position for position, char in enumerate(ALPHABET)}
+
+
+def encode_short_link(recipe_id):
+    if not 0 < recipe_id < MODULUS:
+        raise ValueError(f'id вне диапазона коротких ссылок: {recipe_id}')
+    number = (
+        recipe_id * SHORT_LINK_MULTIPLIER + SHORT_LINK_OFFSET
+    ) % MODULUS
+    chars = []
+    for _ in range(SHORT_LINK_LENGTH):
+        number, position = divmod(number, BASE)
+        chars.append(ALPHABET[position])
+    return ''.join(reversed(chars))
+
+
+def decode_short_link(code):
+    """id рецепта по новому коду или None для чужих и старых кодов."""
+    if len(code) != SHORT_LINK_LENGTH:
+        return None
+    number = 0
+    for char in code:
+        position = POSITIONS.get(char)
+        if position is None:
+            return None
+        number = number * BASE + position
+    recipe_id = (number - SHORT_LINK_OFFSET) * INVERSE % MODULUS
+    return recipe_id or None
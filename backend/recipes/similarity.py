@@ -0,0 +1,176 @@
+"""
+Похожие рецепты по совместному добавлению в избранное (item-to-item).
+
+Матрица пользователь × рецепт хранится разреженной (CSR по пользователям
+и обратный индекс по рецептам). Для пачки рецептов их пользователи
+разворачиваются во все рецепты этих пользователей, и один np.bincount
+по парам даёт плотный блок совместных вхождений «пачка × все рецепты».
+Деление на нормы столбцов даёт косинусное сходство, лучшие K в каждой
+строке выбирает argpartition. Память ограничена размером блока, а не
+числом рецептов в квадрате.
+
+Модуль не зависит от Django: данные загружает и сохраняет команда
+build_recommendations.
+"""
+import numpy as np
+
+# Перемешивание splitmix64 для отпечатков наборов пользователей.
+MIX_MULTIPLIERS = (0xBF58476D1CE4E5B9, 0x94D049BB133111EB)
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+
+def concat_ranges(starts, ends):
+    """Конкатенация диапазонов [start, end) без цикла по Python."""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+
+def mix64(values):
+    values = values.astype(np.uint64) + np.uint64(GOLDEN_GAMMA)
+    for multiplier, shift in zip(MIX_MULTIPLIERS, (30, 27)):
+        values = (values ^ (values >> np.uint64(shift))) * np.uint64(
+            multiplier
+        )
+    return values ^ (values >> np.uint64(31))
+
+
+class Interactions:
+    """
+    Взвешенные пары пользователь — рецепт. Повторы пары (например,
+    избранное и корзина) складываются.
+    """
+
+    def __init__(self, user_ids, recipe_ids, weights=None):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        if weights is None:
+            weights = np.ones(len(user_ids), dtype=np.float64)
+        self.user_ids, user_index = np.unique(user_ids, return_inverse=True)
+        self.recipe_ids, recipe_index = np.unique(
+            recipe_ids, return_inverse=True
+        )
+        size = len(self.recipe_ids)
+        keys, inverse = np.unique(
+            user_index.astype(np.int64) * size + recipe_index,
+            return_inverse=True,
+        )
+        self.values = np.bincount(inverse, weights=weights)
+        self.users = (keys // size).astype(np.int32)
+        self.recipes = (keys % size).astype(np.int32)
+        self.user_indptr = np.concatenate(([0], np.cumsum(
+            np.bincount(self.users, minlength=len(self.user_ids))
+        )))
+        # Обратный индекс: записи каждого рецепта подряд.
+        self.by_recipe = np.argsort(self.recipes, kind='stable')
+        self.recipe_indptr = np.concatenate(([0], np.cumsum(
+            np.bincount(self.recipes, minlength=size)
+        )))
+        self.norms = np.sqrt(
+            np.bincount(self.recipes, weights=self.values ** 2,
+                        minlength=size)
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+    def index_of(self, recipe_ids):
+        """Индексы известных рецептов из списка id."""
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        known = recipe_ids[np.isin(recipe_ids, self.recipe_ids)]
+        return np.unique(np.searchsorted(self.recipe_ids, known))
+
+    def fingerprints(self):
+        """Отпечаток набора (пользователь, вес) для каждого рецепта."""
+        hashes = mix64(
+            mix64(self.user_ids[self.users])
+            ^ np.round(self.values * 1000).astype(np.uint64)
+        )[self.by_recipe]
+        starts = self.recipe_indptr[:-1]
+        if not len(hashes):
+            return hashes.view(np.int64)
+        # Сумма по модулю 2 ** 64 не зависит от порядка записей.
+        return np.add.reduceat(hashes, starts).view(np.int64)
+
+    def entries_of(self, recipes):
+        """Позиции записей рецептов (индексы) и номер рецепта в списке."""
+        starts = self.recipe_indptr[recipes]
+        ends = self.recipe_indptr[recipes + 1]
+        rows = np.repeat(np.arange(len(recipes)), ends - starts)
+        return self.by_recipe[concat_ranges(starts, ends)], rows
+
+    def neighbours(self, recipes):
+        """Рецепты, у которых есть общий пользователь с данными."""
+        entries, _ = self.entries_of(np.asarray(recipes, dtype=np.int64))
+        users = np.unique(self.users[entries])
+        positions = concat_ranges(
+            self.user_indptr[users], self.user_indptr[users + 1]
+        )
+        return np.unique(self.recipes[positions])
+
+    def similarity_blocks(self, recipes, block_cells):
+        """
+        Пачками (индексы рецептов, блок косинусного сходства с каждым
+        рецептом); сходство рецепта с самим собой обнулено.
+        """
+        size = len(self.recipe_ids)
+        chunk_size = max(1, block_cells // max(size, 1))
+        recipes = np.asarray(recipes, dtype=np.int64)
+        for begin in range(0, len(recipes), chunk_size):
+            chunk = recipes[begin:begin + chunk_size]
+            entries, rows = self.entries_of(chunk)
+            users = self.users[entries]
+            starts = self.user_indptr[users]
+            ends = self.user_indptr[users + 1]
+            lengths = ends - starts
+            others = concat_ranges(starts, ends)
+            block = np.bincount(
+                np.repeat(rows, lengths) * size + self.recipes[others],
+                weights=(
+                    np.repeat(self.values[entries], lengths)
+                    * self.values[others]
+                ),
+                minlength=len(chunk) * size,
+            ).reshape(len(chunk), size)
+            block /= self.norms[chunk, None] * self.norms[None, :]
+            block[np.arange(len(chunk)), chunk] = 0
+            yield chunk, block
+
+    @staticmethod
+    def top_k(block, k):
+        """
+        Индексы k лучших столбцов каждой строки по убыванию и их
+        сходство; отсутствующие соседи отмечены сходством 0. При равном
+        сходстве выигрывает больший индекс (более новый рецепт), чтобы
+        результат не зависел от состава пачки.
+        """
+        size = block.shape[1]
+        k = min(k, size - 1)
+        if k <= 0:
+            empty = np.empty((len(block), 0))
+            return empty.astype(np.int64), empty
+        top = np.argpartition(block, size - k, axis=1)[:, size - k:]
+        lowest = np.take_along_axis(block, top, axis=1).min(axis=1)
+        ties = (block == lowest[:, None]).sum(axis=1)
+        taken = (np.take_along_axis(block, top, axis=1)
+                 == lowest[:, None]).sum(axis=1)
+        for row in np.flatnonzero((ties > taken) & (lowest > 0)):
+            values = block[row]
+            top[row] = np.concatenate((
+                np.flatnonzero(values > lowest[row]),
+                np.flatnonzero(values == lowest[row])[ties[row] - taken[row]:],
+            ))
+        scores = np.take_along_axis(block, top, axis=1)
+        order = np.lexsort((-top, -scores))
+        return (
+            np.take_along_axis(top, order, axis=1),
+            np.take_along_axis(scores, order, axis=1),
+        )
+
+    def top_similar(self, recipes, k, block_cells):
+        """Пачками (индексы рецептов, индексы похожих, сходство)."""
+        for chunk, block in self.similarity_blocks(recipes, block_cells):
+            yield (chunk, *self.top_k(block, k))
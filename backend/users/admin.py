@@ -16,16 +16,23 @@ class CustomUserAdmin(BaseUserAdmin):
         'first_name',
         'last_name',
         'is_staff',
+        'recipes_count',
+        'subscribers_count',
         'date_joined',
         'avatar_preview',
     )
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'date_joined')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('-date_joined',)
-    readonly_fields = ('date_joined', 'last_login')
+    readonly_fields = (
+        'date_joined', 'last_login', 'recipes_count', 'subscribers_count'
+    )
 
     fieldsets = BaseUserAdmin.fieldsets + (
-        ('Дополнительная информация', {'fields': ('avatar',)}),
+        (
+            'Дополнительная информация',
+            {'fields': ('avatar', 'recipes_count', 'subscribers_count')},
+        ),
     )
 
     @admin.display(description='Аватар')
@@ -26,6 +26,18 @@ class CustomUser(AbstractUser):
         null=True,
         verbose_name='Аватар',
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии аватара',
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Подписчиков'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')